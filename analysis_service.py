@@ -0,0 +1,234 @@
+"""Service HTTP local d'analyse : modèles chargés une fois, file de jobs bornée et identifiants à interroger.
+
+    POST /jobs            corps JSON {"path": "..."} ou fichier brut (?filename=doc.pdf) -> 202 {"job_id": ...}
+                          429 si la file est pleine
+    GET  /jobs/<job_id>   état du job (queued, running, done, error) et résultat
+    GET  /health          taille de la file et nombre de jobs
+    GET  /metrics         histogrammes des durées par étape (voir metrics.py)
+
+Chaque worker garde son DocumentAnalyzer. L'extraction (OCR, mots-clés, gourmande en CPU) et les appels
+LLM (attente réseau) ont chacun leur plafond de concurrence : un document peut attendre Mistral pendant
+qu'un autre occupe les cœurs avec Tesseract.
+"""
+import contextlib
+import json
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import metrics
+from document_analyzer import SUPPORTED_EXTENSIONS, DocumentAnalyzer
+
+MAX_UPLOAD_BYTES = 500 * 1024 * 1024
+
+
+class AnalysisService:
+    def __init__(self, ocr_concurrency=None, llm_concurrency=4, queue_size=32, max_finished_jobs=1000,
+                 upload_dir=None):
+        self.ocr_concurrency = ocr_concurrency or max(1, (os.cpu_count() or 1) // 2)
+        self.llm_concurrency = llm_concurrency
+        # Assez de workers pour que les deux étapes puissent être pleines en même temps
+        self.worker_count = self.ocr_concurrency + self.llm_concurrency
+        self.cpu_slots = threading.BoundedSemaphore(self.ocr_concurrency)
+        self.llm_slots = threading.BoundedSemaphore(self.llm_concurrency)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.max_finished_jobs = max_finished_jobs
+        self.upload_dir = upload_dir or tempfile.mkdtemp(prefix="poc_frd_uploads_")
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def start(self):
+        """Start the workers, each with its own warm DocumentAnalyzer"""
+        # Les pages OCR d'un document se partagent les cœurs réservés à l'extraction
+        ocr_workers = max(1, (os.cpu_count() or 1) // self.ocr_concurrency)
+        analyzers = [DocumentAnalyzer(ocr_workers=ocr_workers) for _ in range(self.worker_count)]
+        # Le registre de modèles est partagé : un seul chargement suffit pour tous les workers
+        analyzers[0].warm_up()
+        for analyzer in analyzers:
+            worker = threading.Thread(target=self._work, args=(analyzer,), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, file_path, uploaded=False):
+        """Queue a document; returns the job id, or None when the queue is full"""
+        job_id = uuid.uuid4().hex
+        job = {"job_id": job_id, "path": file_path, "status": "queued", "submitted_at": time.time(),
+               "uploaded": uploaded}
+        with self._lock:
+            try:
+                self.queue.put_nowait(job_id)
+            except queue.Full:
+                return None
+            self.jobs[job_id] = job
+        return job_id
+
+    def get_job(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return {key: value for key, value in job.items() if key != "uploaded"} if job else None
+
+    def stats(self):
+        with self._lock:
+            statuses = [job["status"] for job in self.jobs.values()]
+        return {
+            "queued": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "running": statuses.count("running"),
+            "jobs": len(statuses),
+            "ocr_concurrency": self.ocr_concurrency,
+            "llm_concurrency": self.llm_concurrency,
+        }
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self.jobs[job_id].update(fields)
+
+    def _work(self, analyzer):
+        while True:
+            job_id = self.queue.get()
+            with self._lock:
+                job = dict(self.jobs[job_id])
+            self._update(job_id, status="running", started_at=time.time())
+            try:
+                result = self.analyze(analyzer, job["path"])
+                self._update(job_id, status="done", result=result, finished_at=time.time())
+            except Exception as e:
+                self._update(job_id, status="error", error=str(e), finished_at=time.time())
+            finally:
+                if job["uploaded"]:
+                    shutil.rmtree(os.path.dirname(job["path"]), ignore_errors=True)
+                self._forget_old_jobs()
+
+    def analyze(self, analyzer, file_path):
+        """Analyze one document, holding a CPU slot for extraction and an LLM slot for the Mistral calls"""
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Le fichier {file_path} n'existe pas")
+        with metrics.trace_document(file_path):
+            # Contenu déjà analysé : réponse immédiate depuis la base, sans occuper de créneau
+            result, record = analyzer.lookup_or_analyze(file_path,
+                                                        cpu_slot=_slot(self.cpu_slots, "wait_cpu_slot"),
+                                                        llm_slot=_slot(self.llm_slots, "wait_llm_slot"))
+            if record is not None and (analyzer.result_store is not None or analyzer.document_index is not None):
+                analyzer.save_records([record])
+            return result
+
+    def _forget_old_jobs(self):
+        """Drop the oldest finished jobs beyond max_finished_jobs"""
+        with self._lock:
+            finished = [job_id for job_id, job in self.jobs.items() if job["status"] in ("done", "error")]
+            for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+                del self.jobs[job_id]
+
+    def save_upload(self, filename, stream, length):
+        """Copy an uploaded document into its own folder under upload_dir and return its path"""
+        folder = tempfile.mkdtemp(dir=self.upload_dir)
+        path = os.path.join(folder, os.path.basename(filename))
+        remaining = length
+        with open(path, "wb") as f:
+            while remaining > 0:
+                block = stream.read(min(remaining, 1024 * 1024))
+                if not block:
+                    break
+                f.write(block)
+                remaining -= len(block)
+        if remaining:
+            shutil.rmtree(folder, ignore_errors=True)
+            raise ValueError("Upload incomplet")
+        return path
+
+
+@contextlib.contextmanager
+def _slot(semaphore, stage):
+    """Hold one slot of a concurrency cap; the wait is recorded as its own span"""
+    with metrics.span(stage):
+        semaphore.acquire()
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = urlparse(self.path).path.rstrip("/")
+            if path == "/health":
+                return self._send_json(200, service.stats())
+            if path == "/metrics":
+                return self._send_json(200, metrics.histograms())
+            if path.startswith("/jobs/"):
+                job = service.get_job(path[len("/jobs/"):])
+                if job is None:
+                    return self._send_json(404, {"error": "Job inconnu"})
+                return self._send_json(200, job)
+            self._send_json(404, {"error": "Route inconnue"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path.rstrip("/") != "/jobs":
+                return self._send_json(404, {"error": "Route inconnue"})
+            # File pleine : on refuse avant de lire un éventuel upload
+            if service.queue.full():
+                return self._send_json(429, {"error": "File d'attente pleine"}, {"Retry-After": "5"})
+
+            length = int(self.headers.get("Content-Length") or 0)
+            content_type = self.headers.get("Content-Type", "")
+            try:
+                if content_type.startswith("application/json"):
+                    if length > 1024 * 1024:
+                        raise ValueError("Requête trop volumineuse")
+                    file_path = json.loads(self.rfile.read(length) or b"{}").get("path")
+                    if not file_path:
+                        raise ValueError("Champ 'path' manquant")
+                    file_path, uploaded = os.path.abspath(file_path), False
+                else:
+                    filename = parse_qs(url.query).get("filename", [""])[0]
+                    if os.path.splitext(filename)[1].lower() not in SUPPORTED_EXTENSIONS:
+                        raise ValueError(f"Paramètre filename requis, extensions : {', '.join(SUPPORTED_EXTENSIONS)}")
+                    if not 0 < length <= MAX_UPLOAD_BYTES:
+                        raise ValueError("Taille de fichier invalide")
+                    file_path, uploaded = service.save_upload(filename, self.rfile, length), True
+            except ValueError as e:
+                return self._send_json(400, {"error": str(e)})
+
+            job_id = service.submit(file_path, uploaded)
+            if job_id is None:
+                if uploaded:
+                    shutil.rmtree(os.path.dirname(file_path), ignore_errors=True)
+                return self._send_json(429, {"error": "File d'attente pleine"}, {"Retry-After": "5"})
+            self._send_json(202, {"job_id": job_id, "status": "queued"}, {"Location": f"/jobs/{job_id}"})
+
+        def log_message(self, format, *args):
+            print(f"{self.address_string()} - {format % args}", file=sys.stderr)
+
+    return Handler
+
+
+def serve_http(host, port, **service_options):
+    """Start the analysis service and answer HTTP requests until interrupted"""
+    service = AnalysisService(**service_options)
+    service.start()
+    with ThreadingHTTPServer((host, port), make_handler(service)) as server:
+        print(f"Service d'analyse en écoute sur http://{host}:{port} "
+              f"({service.ocr_concurrency} extractions, {service.llm_concurrency} appels LLM en parallèle)",
+              file=sys.stderr)
+        server.serve_forever()
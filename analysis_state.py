@@ -0,0 +1,68 @@
+"""État d'analyse par document, pour la ré-analyse incrémentale.
+
+Pour chaque fichier, on garde l'empreinte et le texte de chaque unité (slide ou page), ainsi que
+le dernier résultat. À la ré-analyse, seules les unités modifiées sont ré-extraites, et les mots-clés,
+résumé et sommaire sont réutilisés si le texte global n'a presque pas changé depuis la version dont ils
+sont issus (les unités de référence, « baseline_units ») : une suite de petites modifications finit
+ainsi par déclencher leur mise à jour.
+"""
+import json
+import os
+
+from content_hash import text_sha256
+
+DEFAULT_STATE_DIR = os.path.join(
+    os.getenv("ANALYSIS_STATE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "poc_frd")),
+    "analysis_state",
+)
+
+
+class AnalysisStateStore:
+    def __init__(self, directory=DEFAULT_STATE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _state_path(self, file_path):
+        return os.path.join(self.directory, text_sha256(os.path.abspath(file_path)) + ".json")
+
+    def load(self, file_path):
+        """Previous state of a file ({"units": [...], "baseline_units": [...], "result": {...}}), or None"""
+        try:
+            with open(self._state_path(file_path), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, file_path, units, result, baseline_units=None):
+        """Save the units and result of a file; baseline_units: units the LLM fields were generated from"""
+        state = {"path": os.path.abspath(file_path), "units": units, "result": result,
+                 "baseline_units": units if baseline_units is None else baseline_units}
+        path = self._state_path(file_path)
+        # Écriture atomique : un arrêt brutal ne laisse pas un état à moitié écrit
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def previous_unit_texts(state):
+    """{unit hash: text} of a previous state, used to skip re-extracting unchanged units"""
+    if not state:
+        return {}
+    return {unit["hash"]: unit["text"] for unit in state["units"] if unit.get("hash")}
+
+
+def baseline_units(state):
+    """Units the keywords, summary and TOC of a previous state were generated from"""
+    # Les états écrits avant l'ajout de baseline_units n'ont que les unités de la dernière version
+    return state.get("baseline_units", state["units"])
+
+
+def changed_fraction(previous_units, units):
+    """Share of the text (in characters) that was added or removed between two versions"""
+    previous_hashes = {unit["hash"] for unit in previous_units}
+    current_hashes = {unit["hash"] for unit in units}
+    added = sum(len(unit["text"]) for unit in units if unit["hash"] not in previous_hashes)
+    removed = sum(len(unit["text"]) for unit in previous_units if unit["hash"] not in current_hashes)
+    total = max(sum(len(unit["text"]) for unit in previous_units), sum(len(unit["text"]) for unit in units), 1)
+    return (added + removed) / total
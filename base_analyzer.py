@@ -0,0 +1,189 @@
+"""Socle commun de PPTAnalyzer et PDFAnalyzer : mots-clés et catégorie par lots, appels LLM (résumé
+et sommaire) et lecture de leurs réponses. Chaque format ne fournit que ses prompts et ses paramètres."""
+import logging
+import os
+from abc import ABC, abstractmethod
+
+import model_registry
+from keywords import extract_keywords_batch
+from classification import classify_embeddings
+from llm_stage import get_llm_stage, parse_json_fields
+from summarization import summarize_map_reduce
+from local_summarizer import fill_missing_summary
+
+logger = logging.getLogger(__name__)
+
+
+class BaseAnalyzer(ABC):
+    # Taille du texte envoyé tel quel dans les prompts (au-delà : tronqué, ou map-reduce)
+    PROMPT_CHARS = 2000
+    # Paramètres KeyBERT du format, partagés par extract_keywords et le mode par lots
+    KEYWORD_PARAMS = {}
+    # Nature du document et consignes de résumé, reprises dans les prompts
+    DOCUMENT_KIND = "un document"
+    SUMMARY_INSTRUCTIONS = "un résumé concis"
+
+    def __init__(self, llm_mode=None, summary_mode=None):
+        # Les modèles sont chargés au premier usage et partagés via model_registry
+        # "combined" : un seul appel LLM (JSON) pour le résumé et le sommaire ; "separate" : deux appels
+        self.llm_mode = llm_mode or os.getenv("LLM_MODE", "separate")
+        # "map_reduce" : résumé de tout le texte par morceaux ; "truncate" : seulement le début du texte
+        self.summary_mode = summary_mode or os.getenv("SUMMARY_MODE", "truncate")
+
+    @property
+    def keyword_model(self):
+        return model_registry.get_keyword_model()
+
+    @property
+    def mistral_client(self):
+        return model_registry.get_mistral_client()
+
+    def extract_keywords(self, text):
+        """Extract keywords from text using KeyBERT"""
+        return self.extract_keywords_many([text])[0]
+
+    def extract_keywords_many(self, texts):
+        """Extract keywords of several texts with one batched KeyBERT pass"""
+        return [features["keywords"] for features in self.extract_features_many(texts)]
+
+    def extract_features_many(self, texts):
+        """Keywords, document embedding and category of several texts, from one batched KeyBERT pass"""
+        logger.debug("Extracting keywords...")
+        try:
+            all_keywords, embeddings = extract_keywords_batch(texts, model=self.keyword_model, return_embeddings=True,
+                                                              **self.KEYWORD_PARAMS)
+
+            if logger.isEnabledFor(logging.DEBUG):
+                for keywords in all_keywords:
+                    logger.debug("Keywords found: " + ", ".join(f"{keyword} ({score:.3f})" for keyword, score in keywords))
+
+            features = [{"keywords": [kw for kw, _ in keywords], "embedding": None, "category": None,
+                         "category_score": None} for keywords in all_keywords]
+
+        except Exception as e:
+            logger.error(f"Error extracting keywords: {str(e)}")
+            return [{"keywords": [], "embedding": None, "category": None, "category_score": None} for _ in texts]
+
+        if embeddings is None:
+            return features
+        try:
+            # Catégorie : centroïde le plus proche de l'embedding déjà calculé, un seul produit matriciel
+            for item, embedding, category in zip(features, embeddings, classify_embeddings(embeddings)):
+                item.update(category, embedding=embedding if embedding.any() else None)
+        except Exception as e:
+            logger.error(f"Error classifying documents: {str(e)}")
+        return features
+
+    def summary_request(self, text, keywords):
+        """Chat completion parameters of the summary prompt"""
+        return {
+            "model": "mistral-tiny",  # ou "mistral-large-latest"
+            "messages": [
+                {
+                    "role": "user",
+                    "content": f"""Voici un texte extrait d'{self.DOCUMENT_KIND}.
+                    Les mots-clés importants sont : {', '.join(keywords)}
+
+                    Texte : {text[:self.PROMPT_CHARS]}
+
+                    Tu dois générer {self.SUMMARY_INSTRUCTIONS}"""
+                }
+            ],
+        }
+
+    @abstractmethod
+    def toc_request(self, text, toc_hints=None):
+        """Chat completion parameters of the table of contents prompt"""
+
+    @abstractmethod
+    def combined_request(self, text, keywords, toc_hints=None):
+        """Single prompt returning the summary and the table of contents as one JSON object"""
+
+    def clean_toc(self, toc):
+        return toc if toc and not toc.lower().startswith("le texte ne") else ""
+
+    def generate_summary(self, text, keywords):
+        logger.debug("Generating summary...")
+        try:
+            response = self.mistral_client.chat.complete(**self.summary_request(text, keywords))
+
+            summary = response.choices[0].message.content
+            logger.debug(f"Generated summary: {summary}")
+            return summary
+
+        except Exception as e:
+            logger.error(f"Error generating summary: {str(e)}")
+            return ""
+
+    def extract_table_of_contents(self, text, toc_hints=None):
+        logger.debug("Extracting/generating table of contents...")
+        try:
+            response = self.mistral_client.chat.complete(**self.toc_request(text, toc_hints))
+
+            toc = response.choices[0].message.content
+            logger.debug(f"Table of contents result: {toc}")
+            return self.clean_toc(toc)
+
+        except Exception as e:
+            logger.error(f"Error extracting table of contents: {str(e)}")
+            return ""
+
+    def llm_requests(self, text, keywords, mode=None, toc_hints=None):
+        """LLM prompts of a document: one combined JSON prompt, or two independent ones run concurrently"""
+        if (mode or self.llm_mode) == "combined":
+            return {"combined": self.combined_request(text, keywords, toc_hints)}
+        return {
+            "summary": self.summary_request(text, keywords),
+            "table_of_contents": self.toc_request(text, toc_hints),
+        }
+
+    def parse_llm_results(self, results):
+        """Turn the LLM stage outputs (content or exception) into the result fields.
+
+        Returns None when a combined reply does not match the expected JSON schema.
+        """
+        if "combined" in results:
+            fields = parse_json_fields(results["combined"], ("summary", "table_of_contents"))
+            if fields is None or not fields["summary"]:
+                return None
+            fields["table_of_contents"] = self.clean_toc(fields["table_of_contents"])
+            return fields
+        summary = results["summary"]
+        if isinstance(summary, Exception):
+            logger.error(f"Error generating summary: {str(summary)}")
+            summary = ""
+        toc = results["table_of_contents"]
+        if isinstance(toc, Exception):
+            logger.error(f"Error extracting table of contents: {str(toc)}")
+            toc = ""
+        return {"summary": summary, "table_of_contents": self.clean_toc(toc)}
+
+    def generate_llm_fields(self, text, keywords, toc_hints=None):
+        """Summary and table of contents, requested concurrently under the shared rate limit"""
+        logger.debug("Generating summary and table of contents...")
+        if self.needs_map_reduce(text):
+            # Sans réponse de Mistral, le résumé est produit par le modèle local (voir local_summarizer)
+            return fill_missing_summary(self.generate_llm_fields_map_reduce(text, keywords, toc_hints), text)
+        fields = self.parse_llm_results(get_llm_stage().run(self.llm_requests(text, keywords, toc_hints=toc_hints)))
+        if fields is None:
+            # Réponse combinée invalide : on repasse par les deux appels séparés
+            logger.warning("Invalid combined LLM response, falling back to separate calls")
+            fields = self.parse_llm_results(
+                get_llm_stage().run(self.llm_requests(text, keywords, mode="separate", toc_hints=toc_hints))
+            )
+        return fill_missing_summary(fields, text)
+
+    def needs_map_reduce(self, text):
+        """Whether the summary should go through map-reduce (text longer than a single prompt)"""
+        return self.summary_mode == "map_reduce" and len(text) > self.PROMPT_CHARS
+
+    def generate_llm_fields_map_reduce(self, text, keywords, toc_hints=None):
+        """Whole-document summary (map-reduce over chunks); the TOC prompt runs during the map step"""
+        summary, extra = summarize_map_reduce(
+            text,
+            keywords,
+            self.DOCUMENT_KIND,
+            self.SUMMARY_INSTRUCTIONS,
+            extra_requests={"table_of_contents": self.toc_request(text, toc_hints)},
+        )
+        return self.parse_llm_results({"summary": summary, "table_of_contents": extra["table_of_contents"]})
@@ -0,0 +1,478 @@
+"""Banc de mesure reproductible : corpus synthétique (PPTX, PDF texte, PDF scanné) et faux serveur Mistral.
+
+    python benchmark.py --slides 40 --pages 20 --scanned-pages 4 --iterations 3 --latency 0.5
+
+Chaque cas (format x point d'entrée) tourne dans un processus neuf, modèles préchargés avant la mesure :
+le pic de mémoire (RSS) est celui du cas seul. Les caches (OCR, réponses LLM, n-grammes, base des résultats,
+analyse incrémentale) et l'index de similarité sont désactivés pour mesurer le coût réel, sauf avec
+--warm-caches. Le rapport donne, par cas, les latences p50/p95, le
+pic RSS et, par étape (voir metrics.py), le débit en pages, octets ou tokens par seconde.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VOCABULARY = (
+    "analyse document rapport projet gestion qualité processus risque contrôle audit données client service "
+    "production stratégie marché budget résultat objectif performance conformité sécurité innovation équipe "
+    "formation développement infrastructure réseau système application utilisateur accès sauvegarde incident "
+    "maintenance planning livraison fournisseur contrat achat facture coût délai indicateur tableau synthèse"
+).split()
+
+# Format -> points d'entrée mesurés
+CASES = {
+    "pptx": ("ppt", "document"),
+    "pdf_text": ("pdf", "document"),
+    "pdf_scanned": ("pdf", "document"),
+}
+# Attribut de volume utilisé pour le débit de chaque étape
+THROUGHPUT_UNITS = ("pages", "slides", "bytes", "chars", "documents", "prompt_tokens_estimate")
+
+
+def make_words(rng, count):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(count))
+
+
+def make_sentences(rng, words):
+    """Text of about `words` words split into sentences"""
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(6, 16))
+        sentences.append(make_words(rng, length).capitalize() + ".")
+        words -= length
+    return " ".join(sentences)
+
+
+def make_pptx(path, slides=20, words_per_slide=80, seed=0):
+    """Synthetic deck: a title slide, then title + bullet slides with speaker notes"""
+    from pptx import Presentation
+    rng = random.Random(seed)
+    presentation = Presentation()
+    title_slide = presentation.slides.add_slide(presentation.slide_layouts[0])
+    title_slide.shapes.title.text = "Rapport " + make_words(rng, 3)
+    title_slide.placeholders[1].text = make_words(rng, 6)
+    for i in range(1, slides):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = f"{i}. " + make_words(rng, 3).capitalize()
+        body = slide.placeholders[1].text_frame
+        body.text = make_sentences(rng, words_per_slide // 4)
+        for _ in range(3):
+            body.add_paragraph().text = make_sentences(rng, words_per_slide // 4)
+        slide.notes_slide.notes_text_frame.text = make_sentences(rng, 20)
+    presentation.save(path)
+    return path
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_text_pdf(path, pages=10, words_per_page=300, seed=0):
+    """Synthetic PDF with a real text layer (Helvetica, WinAnsi), written without any PDF library"""
+    rng = random.Random(seed)
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>",
+               3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"}
+    page_ids = []
+    for page in range(pages):
+        words = make_sentences(rng, words_per_page).split()
+        lines = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+        commands = ["BT", "/F1 11 Tf", "14 TL", "60 780 Td"]
+        if page == 0:
+            commands.append(f"({_pdf_escape('Rapport ' + make_words(rng, 3))}) Tj T* T*")
+        commands += [f"({_pdf_escape(line)}) Tj T*" for line in lines[:50]]
+        commands.append("ET")
+        stream = "\n".join(commands).encode("cp1252")
+        content_id, page_id = 4 + 2 * page, 5 + 2 * page
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        objects[page_id] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        page_ids.append(page_id)
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(output)
+        output += b"%d 0 obj\n%s\nendobj\n" % (object_id, objects[object_id])
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for object_id in sorted(objects):
+        output += b"%010d 00000 n \n" % offsets[object_id]
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(output)
+    return path
+
+
+def make_scanned_pdf(path, pages=3, words_per_page=200, dpi=150, seed=0):
+    """Synthetic image-only PDF (pages rendered as pictures, no text layer): the OCR path"""
+    from PIL import Image, ImageDraw, ImageFont
+    rng = random.Random(seed)
+    try:
+        font = ImageFont.load_default(size=dpi // 6)
+    except TypeError:  # Pillow < 10.1 : police bitmap de taille fixe
+        font = ImageFont.load_default()
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    images = []
+    for _ in range(pages):
+        image = Image.new("L", (width, height), 255)
+        draw = ImageDraw.Draw(image)
+        words = make_sentences(rng, words_per_page).split()
+        y = dpi // 2
+        for i in range(0, len(words), 10):
+            draw.text((dpi // 2, y), " ".join(words[i:i + 10]), fill=0, font=font)
+            y += dpi // 4
+            if y > height - dpi // 2:
+                break
+        images.append(image)
+    images[0].save(path, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+    return path
+
+
+def make_corpus(directory, slides=20, pages=10, scanned_pages=3, seed=0):
+    """Generate one document per case; returns {case: path}"""
+    os.makedirs(directory, exist_ok=True)
+    return {
+        "pptx": make_pptx(os.path.join(directory, "deck.pptx"), slides=slides, seed=seed),
+        "pdf_text": make_text_pdf(os.path.join(directory, "text.pdf"), pages=pages, seed=seed),
+        "pdf_scanned": make_scanned_pdf(os.path.join(directory, "scanned.pdf"), pages=scanned_pages, seed=seed),
+    }
+
+
+class FakeMistralServer:
+    """Local stand-in for the Mistral chat completions API, answering after a fixed latency"""
+
+    def __init__(self, latency=0.5, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Connexions persistantes (keep-alive), comme l'API réelle
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                server.connections += 1
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                server.requests += 1
+                time.sleep(server.latency)
+                body = json.dumps(server.completion(payload)).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+
+    def completion(self, payload):
+        prompt = " ".join(str(message.get("content", "")) for message in payload.get("messages", []))
+        if (payload.get("response_format") or {}).get("type") == "json_object":
+            content = json.dumps({"summary": "Résumé synthétique du document.",
+                                  "table_of_contents": "1. Introduction\n2. Analyse\n3. Conclusion"},
+                                 ensure_ascii=False)
+        else:
+            content = "Résumé synthétique du document.\n1. Introduction\n2. Analyse\n3. Conclusion"
+        prompt_tokens = max(1, len(prompt) // 4)
+        completion_tokens = max(1, len(content) // 4)
+        return {
+            "id": uuid.uuid4().hex,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "mistral-tiny"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeMistralClient:
+    """Minimal HTTP client of FakeMistralServer with the client.chat.complete interface (no mistralai needed)"""
+
+    def __init__(self, url):
+        self.url = url
+        self.chat = self
+
+    def complete(self, **kwargs):
+        import urllib.request
+        from types import SimpleNamespace
+        request = urllib.request.Request(f"{self.url}/v1/chat/completions", data=json.dumps(kwargs).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            return self.parse_response(json.load(response))
+
+    @staticmethod
+    def parse_response(payload):
+        from types import SimpleNamespace
+        message = SimpleNamespace(**payload["choices"][0]["message"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)],
+                               usage=SimpleNamespace(**payload["usage"]))
+
+
+class FakeAsyncMistralClient(FakeMistralClient):
+    """complete_async over keep-alive connections pooled for the whole process, like the httpx.AsyncClient
+    of mistralai: a connection opened by one event loop cannot be reused from another one"""
+
+    def __init__(self, url):
+        super().__init__(url)
+        from urllib.parse import urlsplit
+        self.address = urlsplit(url)
+        self._pool = []
+        self._pool_lock = threading.Lock()
+
+    async def complete_async(self, **kwargs):
+        import asyncio
+        with self._pool_lock:
+            connection = self._pool.pop() if self._pool else None
+        if connection is None:
+            connection = await asyncio.open_connection(self.address.hostname, self.address.port)
+        reader, writer = connection
+        body = json.dumps(kwargs).encode("utf-8")
+        writer.write(f"POST /v1/chat/completions HTTP/1.1\r\nHost: {self.address.netloc}\r\n"
+                     f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode("ascii") + body)
+        await writer.drain()
+        await reader.readline()  # ligne de statut
+        length = 0
+        while (line := await reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        payload = json.loads(await reader.readexactly(length))
+        with self._pool_lock:
+            self._pool.append(connection)
+        return self.parse_response(payload)
+
+
+def async_client(url):
+    """The real async Mistral client pointed at the fake server, or its stand-in when mistralai is missing"""
+    try:
+        from mistralai import Mistral
+    except ImportError:
+        return FakeAsyncMistralClient(url)
+    return Mistral(api_key="benchmark", server_url=url)
+
+
+def check_llm_stage(latency=0.2, requests_per_second=2.0, documents=4):
+    """Check the LLM stage against the fake server: rate limit, merged duplicates, free cache hits"""
+    from llm_cache import CachedChatClient
+    from llm_stage import LLMStage, RateLimiter
+    server = FakeMistralServer(latency=latency).start()
+    try:
+        client = CachedChatClient(FakeMistralClient(server.url))
+        stage = LLMStage(client=client, limiter=RateLimiter(requests_per_second=requests_per_second))
+
+        def batches(duplicates):
+            # Deux prompts par document ; avec duplicates, chaque document est envoyé deux fois
+            return [{name: {"model": "mistral-tiny", "messages": [{"role": "user", "content": f"{name} {i}"}]}
+                     for name in ("summary", "toc")}
+                    for i in list(range(documents)) * (2 if duplicates else 1)]
+
+        checks = {}
+        start = time.perf_counter()
+        stage.run_many(batches(duplicates=True))
+        elapsed = time.perf_counter() - start
+        # Le seau démarre plein (capacité max(1, débit)) puis délivre requests_per_second appels par seconde
+        minimum = (2 * documents - max(1.0, requests_per_second)) / requests_per_second
+        checks["rate_limited"] = elapsed >= minimum * 0.95
+        checks["duplicates_merged"] = server.requests == 2 * documents
+        # Les requêtes fusionnées n'attendent pas le limiteur : seule la moitié des requêtes le consomme
+        checks["merged_not_rate_limited"] = elapsed < minimum + 2 / requests_per_second
+
+        start = time.perf_counter()
+        stage.run_many(batches(duplicates=True))
+        cached_elapsed = time.perf_counter() - start
+        checks["cache_hits_not_rate_limited"] = cached_elapsed < 1 / requests_per_second
+        checks["cache_hits_not_sent"] = server.requests == 2 * documents
+
+        # Client asynchrone à connexions persistantes : un appel par document (comme l'analyse d'un
+        # dossier), puis plusieurs documents en parallèle depuis des threads (comme le service HTTP)
+        from concurrent.futures import ThreadPoolExecutor
+        stage = LLMStage(client=CachedChatClient(async_client(server.url), ttl=0),
+                         limiter=RateLimiter(requests_per_second=1000))
+        requests_before, connections_before = server.requests, server.connections
+        outputs = [stage.run(batch) for batch in batches(duplicates=False)]
+        with ThreadPoolExecutor(max_workers=documents) as pool:
+            outputs += list(pool.map(stage.run, batches(duplicates=False)))
+        errors = [output for result in outputs for output in result.values() if isinstance(output, Exception)]
+        checks["keep_alive_documents"] = not errors
+        keep_alive_requests = server.requests - requests_before
+        keep_alive_connections = server.connections - connections_before
+        checks["keep_alive_connections_reused"] = keep_alive_connections < keep_alive_requests
+    finally:
+        server.stop()
+    print(f"LLM stage: {4 * documents} requests, {requests_before} upstream calls, {elapsed:.2f} s "
+          f"(>= {minimum:.2f} s expected), cached rerun {cached_elapsed:.3f} s")
+    print(f"Keep-alive: {2 * len(outputs)} requests over {keep_alive_connections} connections"
+          + (f", first error: {errors[0]!r}" if errors else ""))
+    for name, ok in checks.items():
+        print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return all(checks.values())
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process, in MB (None when it cannot be measured)"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Ko sous Linux, octets sous macOS
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+
+def stage_report(histograms):
+    """Per-stage latency and throughput (units per second of time spent in the stage)"""
+    report = {}
+    for stage, stats in histograms.items():
+        seconds = stats["total_ms"] / 1000
+        throughput = {
+            f"{unit}_per_s": round(stats["totals"][unit] / seconds, 1)
+            for unit in THROUGHPUT_UNITS if stats["totals"].get(unit) and seconds > 0
+        }
+        report[stage] = {"count": stats["count"], "p50_ms": stats["p50_ms"], "p95_ms": stats["p95_ms"],
+                         "total_ms": stats["total_ms"], **throughput}
+    return report
+
+
+def run_case(case, entry_point, path, iterations, warm_caches):
+    """Run one case in the current (fresh) process and return its measurements"""
+    import contextlib
+    import metrics
+    import model_registry
+    if not warm_caches:
+        # Avant tout import : load_dotenv (ppt_analysis) ne remplace pas une variable déjà définie, un
+        # RESULT_STORE=1 du .env servirait sinon chaque itération depuis la base
+        os.environ.update({"LLM_CACHE_TTL": "0", "NGRAM_CACHE": "0", "INCREMENTAL": "0",
+                           "RESULT_STORE": "0", "DOCUMENT_INDEX": "0"})
+
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        if entry_point == "document":
+            from document_analyzer import DocumentAnalyzer
+            analyzer = DocumentAnalyzer()
+            if not warm_caches:
+                analyzer.pdf_analyzer.ocr_cache = None
+            run = analyzer.analyze_document
+            analyzer.warm_up()
+        else:
+            if entry_point == "ppt":
+                from ppt_analysis import PPTAnalyzer
+                run = PPTAnalyzer().analyze
+            else:
+                from pdf_analyzer import PDFAnalyzer
+                run = PDFAnalyzer(ocr_cache=None if warm_caches else False).analyze
+            model_registry.get_keyword_model()
+            model_registry.get_mistral_client()
+        # Passage à blanc : imports paresseux et premiers appels hors mesure
+        run(path)
+        metrics.registry.reset()
+
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            run(path)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    return {
+        "case": case,
+        "entry_point": entry_point,
+        "iterations": iterations,
+        "p50_ms": round(metrics.percentile(latencies, 50), 1),
+        "p95_ms": round(metrics.percentile(latencies, 95), 1),
+        "documents_per_s": round(iterations / (sum(latencies) / 1000), 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stage_report(metrics.histograms()),
+    }
+
+
+def run_benchmark(corpus, iterations=3, latency=0.5, warm_caches=False, cases=None):
+    """Run every case against a local fake Mistral server, each in its own process"""
+    server = FakeMistralServer(latency=latency).start()
+    # Les processus enfants héritent de l'URL du faux serveur (voir model_registry.get_mistral_client)
+    os.environ["MISTRAL_SERVER_URL"] = server.url
+    os.environ.setdefault("MISTRAL_API_KEY", "benchmark")
+    results = []
+    try:
+        context = multiprocessing.get_context("spawn")
+        for case in cases or CASES:
+            for entry_point in CASES[case]:
+                print(f"Benchmark {case} / {entry_point}...", file=sys.stderr)
+                with context.Pool(1) as pool:
+                    results.append(pool.apply(run_case, (case, entry_point, corpus[case], iterations, warm_caches)))
+    finally:
+        server.stop()
+    return {"latency_s": latency, "iterations": iterations, "warm_caches": warm_caches,
+            "llm_requests": server.requests, "results": results}
+
+
+def print_report(report):
+    for result in report["results"]:
+        print(f"\n{result['case']} / {result['entry_point']}: p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, "
+              f"{result['documents_per_s']} doc/s, pic RSS {result['peak_rss_mb']} Mo")
+        for stage, stats in result["stages"].items():
+            throughput = ", ".join(f"{key} {value}" for key, value in stats.items() if key.endswith("_per_s"))
+            print(f"  {stage:<16} n={stats['count']:<5} p50 {stats['p50_ms']:>9} ms  p95 {stats['p95_ms']:>9} ms"
+                  f"  {throughput}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Banc de mesure de l'analyseur de documents")
+    parser.add_argument("--slides", type=int, default=20, help="slides du deck synthétique")
+    parser.add_argument("--pages", type=int, default=10, help="pages du PDF avec couche texte")
+    parser.add_argument("--scanned-pages", type=int, default=3, help="pages du PDF scanné (OCR)")
+    parser.add_argument("--iterations", type=int, default=3, help="analyses mesurées par cas")
+    parser.add_argument("--latency", type=float, default=0.5, help="latence du faux serveur Mistral (s)")
+    parser.add_argument("--cases", default=",".join(CASES), help="cas à mesurer, séparés par des virgules")
+    parser.add_argument("--warm-caches", action="store_true", help="laisse les caches OCR / LLM / n-grammes actifs")
+    parser.add_argument("--seed", type=int, default=0, help="graine du corpus synthétique")
+    parser.add_argument("--corpus-dir", default=None, help="dossier du corpus (par défaut : dossier temporaire)")
+    parser.add_argument("--output", default=None, help="fichier JSON du rapport")
+    parser.add_argument("--check-llm", action="store_true",
+                        help="vérifie seulement l'étape LLM (débit, fusion, cache) contre le faux serveur")
+    args = parser.parse_args()
+
+    if args.check_llm:
+        sys.exit(0 if check_llm_stage() else 1)
+
+    corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix="poc_frd_bench_")
+    corpus = make_corpus(corpus_dir, slides=args.slides, pages=args.pages, scanned_pages=args.scanned_pages,
+                         seed=args.seed)
+    report = run_benchmark(corpus, iterations=args.iterations, latency=args.latency,
+                           warm_caches=args.warm_caches, cases=args.cases.split(","))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
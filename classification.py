@@ -0,0 +1,132 @@
+"""Classement des documents par centroïde le plus proche, sur l'embedding MiniLM déjà calculé pour KeyBERT.
+
+Chaque catégorie est décrite par quelques phrases, encodées une seule fois (registre de modèles, puis
+cache disque) et moyennées en un centroïde. Classer n documents revient à un produit matriciel
+(n x d) . (d x k), au lieu d'une passe NLI par catégorie et par document avec bart-large-mnli.
+
+Les catégories se remplacent avec CATEGORY_LABELS_FILE : un JSON {catégorie: [descriptions...]}.
+"""
+import json
+import os
+
+import numpy as np
+
+import model_registry
+from content_hash import text_sha256
+
+# Descriptions en français et en anglais : le modèle d'embedding par défaut (MiniLM) est anglophone
+DEFAULT_LABELS = {
+    "Rapport": [
+        "Rapport d'analyse présentant un contexte, des constats, des résultats et des recommandations.",
+        "Analysis report with findings, results, conclusions and recommendations.",
+    ],
+    "Procédure": [
+        "Procédure ou mode opératoire décrivant des étapes, des rôles et des contrôles à appliquer.",
+        "Step-by-step procedure or operating instructions with roles and controls.",
+    ],
+    "Politique et charte": [
+        "Charte, politique ou règlement fixant des principes, des règles et des obligations.",
+        "Policy, charter or code of conduct setting principles, rules and obligations.",
+    ],
+    "Formation": [
+        "Support de formation ou cours expliquant des notions avec des exemples et des exercices.",
+        "Training material or course explaining concepts with examples and exercises.",
+    ],
+    "Compte rendu": [
+        "Compte rendu de réunion avec participants, points abordés, décisions et actions.",
+        "Meeting minutes listing attendees, topics discussed, decisions and action items.",
+    ],
+    "Projet": [
+        "Présentation de projet avec objectifs, planning, jalons, budget et risques.",
+        "Project presentation with goals, schedule, milestones, budget and risks.",
+    ],
+    "Financier": [
+        "Document financier : budget, comptes, chiffre d'affaires, coûts et prévisions.",
+        "Financial document about budget, accounts, revenue, costs and forecasts.",
+    ],
+    "Technique": [
+        "Documentation technique d'un système, d'une architecture, d'une application ou d'une infrastructure.",
+        "Technical documentation of a system, software architecture, application or infrastructure.",
+    ],
+}
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.getenv("CATEGORY_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "poc_frd")),
+    "category_centroids",
+)
+
+
+def load_labels():
+    """Categories and their descriptions, from CATEGORY_LABELS_FILE when set"""
+    path = os.getenv("CATEGORY_LABELS_FILE")
+    if not path:
+        return DEFAULT_LABELS
+    with open(path, encoding="utf-8") as f:
+        labels = json.load(f)
+    return {name: [descriptions] if isinstance(descriptions, str) else descriptions
+            for name, descriptions in labels.items()}
+
+
+class CentroidClassifier:
+    def __init__(self, names, centroids, min_score=0.0):
+        self.names = list(names)
+        self.centroids = np.asarray(centroids, dtype=np.float32)  # (catégories, dimension), normalisés
+        self.min_score = min_score
+
+    def classify(self, embeddings):
+        """Nearest centroid of each (normalized) document embedding; [{"category", "category_score"}, ...]
+
+        Rows that are all zeros (documents without text) get no category.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings[None, :]
+        # Similarité cosinus de tous les documents avec toutes les catégories en un seul produit
+        scores = embeddings @ self.centroids.T
+        best = scores.argmax(axis=1)
+        results = []
+        for i, index in enumerate(best):
+            score = float(scores[i, index])
+            if not embeddings[i].any() or score < self.min_score:
+                results.append({"category": None, "category_score": None})
+            else:
+                results.append({"category": self.names[index], "category_score": round(score, 4)})
+        return results
+
+
+def build_centroids(model, labels):
+    """Normalized mean embedding of each category's descriptions (one encoding call for all of them)"""
+    descriptions = [text for texts in labels.values() for text in texts]
+    vectors = np.asarray(model.model.embed(descriptions), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+    centroids, start = [], 0
+    for texts in labels.values():
+        mean = vectors[start:start + len(texts)].mean(axis=0)
+        centroids.append(mean / (np.linalg.norm(mean) or 1.0))
+        start += len(texts)
+    return np.vstack(centroids)
+
+
+def get_classifier(labels=None, model_name=model_registry.DEFAULT_KEYWORD_MODEL, backend=None):
+    """Shared classifier; label centroids are computed once per process and cached on disk"""
+    labels = labels or load_labels()
+    backend = backend or os.getenv("KEYWORD_BACKEND", "torch")
+    labels_key = text_sha256(model_name, backend, json.dumps(labels, sort_keys=True, ensure_ascii=False))
+
+    def load():
+        path = os.path.join(DEFAULT_CACHE_DIR, labels_key + ".npy")
+        try:
+            centroids = np.load(path)
+        except (OSError, ValueError):
+            centroids = build_centroids(model_registry.get_keyword_model(model_name, backend), labels)
+            os.makedirs(DEFAULT_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(tmp_path, centroids)
+            os.replace(tmp_path, path)
+        return CentroidClassifier(labels, centroids, min_score=float(os.getenv("CATEGORY_MIN_SCORE", 0.0)))
+    return model_registry.get_model(("classifier", labels_key), load)
+
+
+def classify_embeddings(embeddings):
+    """Category of each document embedding, with the shared classifier"""
+    return get_classifier().classify(embeddings)
@@ -0,0 +1,20 @@
+"""Empreintes de contenu (SHA-256) utilisées comme clés de cache"""
+import hashlib
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Hash a file by streaming it, without loading it in memory"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def text_sha256(*parts):
+    """Hash one or more strings (separated so that ("ab", "c") != ("a", "bc"))"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
@@ -1,40 +1,492 @@
 from ppt_analysis import PPTAnalyzer
 from pdf_analyzer import PDFAnalyzer
+import model_registry
+from llm_stage import get_llm_stage
+from local_summarizer import fill_missing_summary
+from analysis_state import AnalysisStateStore, baseline_units, changed_fraction, previous_unit_texts
+from result_store import ResultStore
+from document_index import DocumentEmbeddingIndex
+from content_hash import file_sha256
+import metrics
+import contextlib
+import json
+import logging
 import os
+import socketserver
+import sys
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+SUPPORTED_EXTENSIONS = ('.ppt', '.pptx', '.pdf')
+
+logger = logging.getLogger(__name__)
 
 class DocumentAnalyzer:
-    def __init__(self):
+    def __init__(self, ocr_workers=None, incremental=None, result_store=None, document_index=None):
         self.ppt_analyzer = PPTAnalyzer()
-        self.pdf_analyzer = PDFAnalyzer()
+        self.pdf_analyzer = PDFAnalyzer(ocr_workers=ocr_workers)
+        # Ré-analyse incrémentale : état par document (empreintes des slides/pages, dernier résultat)
+        if incremental is None:
+            incremental = os.getenv("INCREMENTAL", "0") == "1"
+        self.state_store = AnalysisStateStore() if incremental else None
+        # Part du texte modifiée en deçà de laquelle mots-clés, résumé et sommaire sont réutilisés
+        self.reuse_threshold = float(os.getenv("INCREMENTAL_THRESHOLD", 0.05))
+        # Base des résultats (RESULT_STORE=1) : un contenu déjà analysé est servi sans OCR ni LLM
+        if result_store is None:
+            result_store = ResultStore() if os.getenv("RESULT_STORE", "0") == "1" else False
+        self.result_store = result_store or None
+        # Index de similarité (DOCUMENT_INDEX=1) : l'embedding de chaque document, déjà calculé pour KeyBERT
+        if document_index is None:
+            document_index = DocumentEmbeddingIndex() if os.getenv("DOCUMENT_INDEX", "0") == "1" else False
+        self.document_index = document_index or None
         
     def analyze_document(self, file_path):
         """Analyze a document based on its extension"""
         # Vérifier si le fichier existe
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"Le fichier {file_path} n'existe pas")
+
+        # Trace par document (durées de chaque étape), exportée si METRICS_DIR est défini
+        with metrics.trace_document(file_path):
+            return self._analyze_document(file_path)
+
+    def _analyze_document(self, file_path):
+        if self.result_store is not None or self.document_index is not None:
+            result, record = self.lookup_or_analyze(file_path)
+            if record is not None:
+                self.save_records([record])
+            return result
+
+        if self.state_store is not None:
+            return self.analyze_incremental(file_path)
             
         # Obtenir l'extension en minuscules
         extension = os.path.splitext(file_path)[1].lower()
         
         try:
             if extension in ['.ppt', '.pptx']:
-                print("\nDétection d'un fichier PowerPoint")
+                logger.info("Détection d'un fichier PowerPoint")
                 return self.ppt_analyzer.analyze(file_path)
                 
             elif extension == '.pdf':
-                print("\nDétection d'un fichier PDF")
+                logger.info("Détection d'un fichier PDF")
                 return self.pdf_analyzer.analyze(file_path)
                 
             else:
                 raise ValueError(f"Format de fichier non supporté: {extension}")
                 
         except Exception as e:
-            print(f"Erreur lors de l'analyse: {str(e)}")
+            logger.error(f"Erreur lors de l'analyse: {str(e)}")
             raise
 
+    def lookup_or_analyze(self, file_path, cpu_slot=None, llm_slot=None):
+        """Stored result of this file content, or a fresh analysis; returns (result, record to store or None)"""
+        content_hash = file_sha256(file_path)
+        if self.result_store is not None:
+            with metrics.span("result_store_lookup") as attrs:
+                stored = self.result_store.get(content_hash)
+                attrs["cache_hit"] = stored is not None
+            if stored is not None:
+                logger.info("Résultat trouvé dans la base (même contenu déjà analysé)")
+                return stored, None
+        record = self.analyze_record(file_path, content_hash, cpu_slot, llm_slot)
+        return record["result"], record
+
+    def save_records(self, records):
+        """Persist analysis records in the result store and their embeddings in the similarity index"""
+        save_records(records, self.result_store, self.document_index)
+
+    def analyze_record(self, file_path, content_hash=None, cpu_slot=None, llm_slot=None):
+        """Analyze a document into a result store record: result, full text and text of each page or slide.
+
+        cpu_slot / llm_slot: context managers held during extraction and during the LLM calls (concurrency
+        caps of the HTTP service); an incremental re-analysis holds cpu_slot throughout.
+        """
+        analyzer = self.analyzer_for(file_path)
+        cpu_slot = cpu_slot or contextlib.nullcontext()
+        llm_slot = llm_slot or contextlib.nullcontext()
+        if self.state_store is not None:
+            # Ré-analyse incrémentale : l'essentiel du coût est l'extraction
+            with cpu_slot:
+                content, result = self._incremental_analysis(file_path)
+        else:
+            with cpu_slot:
+                content = analyzer.extract_content(file_path)
+            if content["text"].strip():
+                with llm_slot:
+                    llm_fields = analyzer.generate_llm_fields(content["text"], content["keywords"],
+                                                              **self._llm_hints(content))
+            else:
+                llm_fields = {"summary": "", "table_of_contents": ""}
+            result = analyzer.build_result(content, llm_fields)
+        return {
+            "content_hash": content_hash or file_sha256(file_path),
+            "path": os.path.abspath(file_path),
+            "result": result,
+            "text": content["text"],
+            "pages": [unit["text"] for unit in content["units"]],
+            # Embedding MiniLM calculé avec les mots-clés (None si le texte est vide ou réutilisé)
+            "embedding": content.get("embedding"),
+        }
+
+    def analyze_incremental(self, file_path):
+        """Re-analyze a document, redoing only what its modified slides or pages require"""
+        return self._incremental_analysis(file_path)[1]
+
+    def _incremental_analysis(self, file_path):
+        analyzer = self.analyzer_for(file_path)
+        previous = self.state_store.load(file_path)
+        content = analyzer.extract_content(file_path, with_keywords=False,
+                                           previous_units=previous_unit_texts(previous))
+
+        # Écart mesuré depuis la version dont viennent les mots-clés et le résumé, pas depuis la dernière :
+        # des modifications successives s'additionnent
+        baseline = baseline_units(previous) if previous else None
+        fraction = changed_fraction(baseline, content["units"]) if previous else 1.0
+        reuse = previous is not None and fraction <= self.reuse_threshold
+        if reuse:
+            # Texte quasi inchangé : on garde mots-clés, résumé et sommaire de l'analyse précédente
+            logger.info(f"Texte modifié à {fraction:.1%} : réutilisation des mots-clés et du résumé")
+            content["keywords"] = previous["result"]["keywords"]
+            content["category"] = previous["result"].get("category")
+            content["category_score"] = previous["result"].get("category_score")
+            llm_fields = {key: previous["result"][key] for key in ("summary", "table_of_contents")}
+        elif content["text"].strip():
+            content.update(analyzer.extract_features_many([content["text"]])[0])
+            llm_fields = analyzer.generate_llm_fields(content["text"], content["keywords"],
+                                                      **self._llm_hints(content))
+        else:
+            llm_fields = {"summary": "", "table_of_contents": ""}
+
+        result = analyzer.build_result(content, llm_fields)
+        # Champs régénérés : la version courante devient la nouvelle référence
+        self.state_store.save(file_path, content["units"], result, baseline if reuse else None)
+        return content, result
+
+    def analyzer_for(self, file_path):
+        """Return the analyzer matching the file extension"""
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension in ['.ppt', '.pptx']:
+            return self.ppt_analyzer
+        if extension == '.pdf':
+            return self.pdf_analyzer
+        raise ValueError(f"Format de fichier non supporté: {extension}")
+
+    def analyze_documents(self, file_paths):
+        """Analyze several documents, sending the LLM prompts of all of them concurrently"""
+        contents = []
+        for file_path in file_paths:
+            if not os.path.exists(file_path):
+                raise FileNotFoundError(f"Le fichier {file_path} n'existe pas")
+            analyzer = self.analyzer_for(file_path)
+            contents.append((analyzer, analyzer.extract_content(file_path, with_keywords=False)))
+
+        # Mots-clés et catégories : un seul passage KeyBERT par format pour tous les documents
+        for analyzer in (self.ppt_analyzer, self.pdf_analyzer):
+            group = [content for owner, content in contents if owner is analyzer and content["text"].strip()]
+            if group:
+                for content, features in zip(group, analyzer.extract_features_many([c["text"] for c in group])):
+                    content.update(features)
+
+        # Les documents sans texte n'ont pas de prompt ; les longs documents en map-reduce sont traités à part
+        map_reduce = [analyzer.needs_map_reduce(content["text"]) for analyzer, content in contents]
+        batches = [
+            analyzer.llm_requests(content["text"], content["keywords"], **self._llm_hints(content))
+            if content["text"].strip() and not long_text else {}
+            for (analyzer, content), long_text in zip(contents, map_reduce)
+        ]
+        outputs = get_llm_stage().run_many(batches)
+        fields = [
+            analyzer.parse_llm_results(output) if output else {"summary": "", "table_of_contents": ""}
+            for (analyzer, _), output in zip(contents, outputs)
+        ]
+        for i, long_text in enumerate(map_reduce):
+            if long_text:
+                analyzer, content = contents[i]
+                fields[i] = analyzer.generate_llm_fields(content["text"], content["keywords"],
+                                                         **self._llm_hints(content))
+
+        # Réponses combinées invalides : un second tour avec les appels séparés
+        retry = [i for i, llm_fields in enumerate(fields) if llm_fields is None]
+        if retry:
+            logger.warning(f"{len(retry)} invalid combined LLM responses, falling back to separate calls")
+            retry_batches = [
+                contents[i][0].llm_requests(contents[i][1]["text"], contents[i][1]["keywords"], mode="separate",
+                                            **self._llm_hints(contents[i][1]))
+                for i in retry
+            ]
+            for i, output in zip(retry, get_llm_stage().run_many(retry_batches)):
+                fields[i] = contents[i][0].parse_llm_results(output)
+
+        # Résumés manquants (Mistral injoignable) : repli sur le modèle local
+        for i, long_text in enumerate(map_reduce):
+            if not long_text:
+                fill_missing_summary(fields[i], contents[i][1]["text"])
+
+        return [analyzer.build_result(content, llm_fields) for (analyzer, content), llm_fields in zip(contents, fields)]
+
+    def _llm_hints(self, content):
+        # Seules les présentations fournissent les titres de slides comme indices de sommaire
+        return {"toc_hints": content["toc_hints"]} if "toc_hints" in content else {}
+
+    def warm_up(self, formats=("pptx", "pdf")):
+        """Load models and heavy libraries ahead of time (worker mode)"""
+        logger.info("Pré-chargement des modèles...")
+        model_registry.get_keyword_model()
+        model_registry.get_mistral_client()
+        if "pptx" in formats:
+            import pptx  # noqa: F401
+        if "pdf" in formats:
+            import pdf2image  # noqa: F401
+            import pytesseract  # noqa: F401
+
+    def analyze_line(self, line):
+        """Analyze one path read by a worker and return a JSON line"""
+        file_path = line.strip()
+        try:
+            # Les messages de progression vont sur stderr pour ne pas polluer la sortie JSON
+            with contextlib.redirect_stdout(sys.stderr):
+                results = self.analyze_document(file_path)
+            record = {"path": file_path, "results": results}
+        except Exception as e:
+            record = {"path": file_path, "error": str(e)}
+        return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def save_records(records, result_store=None, document_index=None):
+    if result_store is not None:
+        result_store.put_many(records)
+    if document_index is not None:
+        indexed = [record for record in records if record.get("embedding") is not None]
+        if indexed:
+            document_index.add([record["content_hash"] for record in indexed],
+                               [record["embedding"] for record in indexed],
+                               [record["path"] for record in indexed])
+
+
+def serve_stdin(analyzer):
+    """Worker mode: read one file path per line on stdin, write one JSON line per result"""
+    for line in sys.stdin:
+        if line.strip():
+            sys.stdout.write(analyzer.analyze_line(line))
+            sys.stdout.flush()
+
+
+def serve_socket(analyzer, host, port):
+    """Worker mode over TCP: same line protocol as serve_stdin, one client at a time"""
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for raw in self.rfile:
+                line = raw.decode("utf-8")
+                if line.strip():
+                    self.wfile.write(analyzer.analyze_line(line).encode("utf-8"))
+                    self.wfile.flush()
+
+    socketserver.TCPServer.allow_reuse_address = True
+    with socketserver.TCPServer((host, port), Handler) as server:
+        print(f"Worker en écoute sur {host}:{port}", file=sys.stderr)
+        server.serve_forever()
+
+
+def iter_input_files(source):
+    """Yield the documents of a directory (recursively) or of a manifest file (one path per line)"""
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                    yield os.path.abspath(os.path.join(root, name))
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, encoding="utf-8") as manifest:
+            for line in manifest:
+                path = line.strip()
+                if path and not path.startswith("#"):
+                    yield os.path.abspath(os.path.join(base, path))
+
+
+def read_completed(output_path):
+    """Paths already analyzed successfully in a previous run (lines with results)"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as output:
+        for line in output:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # dernière ligne tronquée par un arrêt brutal
+            if "results" in record:
+                completed.add(record["path"])
+    return completed
+
+
+_worker_analyzer = None
+# Documents insérés par transaction dans la base de résultats en mode batch
+STORE_BATCH_SIZE = 50
+
+
+def _init_batch_worker(ocr_workers, workers):
+    """Process pool initializer: one warm analyzer per worker"""
+    global _worker_analyzer
+    # Chaque processus a son propre limiteur : on lui donne sa part du débit Mistral autorisé
+    for name, default in (("MISTRAL_REQUESTS_PER_SECOND", 1), ("MISTRAL_TOKENS_PER_MINUTE", 500_000)):
+        os.environ[name] = str(float(os.getenv(name, default)) / workers)
+    with contextlib.redirect_stdout(sys.stderr):
+        _worker_analyzer = DocumentAnalyzer(ocr_workers=ocr_workers)
+        _worker_analyzer.warm_up()
+
+
+def _analyze_in_worker(file_path):
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            if _worker_analyzer.result_store is None and _worker_analyzer.document_index is None:
+                return {"path": file_path, "results": _worker_analyzer.analyze_document(file_path)}
+            # Base de résultats et index : l'insertion se fait par lots dans le processus principal
+            with metrics.trace_document(file_path):
+                result, store_record = _worker_analyzer.lookup_or_analyze(file_path)
+            return {"path": file_path, "results": result, "store_record": store_record}
+    except Exception as e:
+        return {"path": file_path, "error": str(e)}
+
+
+def analyze_many(source, output_path, workers=None):
+    """Analyze a corpus with a process pool, appending one JSONL line per finished document.
+
+    Documents already present with results in output_path are skipped, so a run can be resumed.
+    """
+    workers = workers or os.cpu_count() or 1
+    completed = read_completed(output_path)
+    paths = (path for path in iter_input_files(source) if path not in completed)
+    if completed:
+        print(f"Reprise : {len(completed)} documents déjà analysés", file=sys.stderr)
+
+    # Les pages OCR de chaque worker se partagent les cœurs restants
+    ocr_workers = max(1, (os.cpu_count() or 1) // workers)
+    done_count = failed_count = 0
+    # Seul le processus principal écrit dans la base de résultats et l'index de similarité
+    result_store = ResultStore() if os.getenv("RESULT_STORE", "0") == "1" else None
+    document_index = DocumentEmbeddingIndex() if os.getenv("DOCUMENT_INDEX", "0") == "1" else None
+    store_records = []
+    with open(output_path, "a", encoding="utf-8") as output, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                initargs=(ocr_workers, workers)) as pool:
+        pending = set()
+        for path in paths:
+            pending.add(pool.submit(_analyze_in_worker, path))
+            # Fenêtre bornée : on ne met pas des dizaines de milliers de tâches en file
+            if len(pending) >= workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                done_count, failed_count = _write_records(finished, output, done_count, failed_count,
+                                                          store_records)
+                if len(store_records) >= STORE_BATCH_SIZE:
+                    save_records(store_records, result_store, document_index)
+                    store_records.clear()
+        finished, _ = wait(pending)
+        done_count, failed_count = _write_records(finished, output, done_count, failed_count, store_records)
+    save_records(store_records, result_store, document_index)
+
+    print(f"Analyse terminée : {done_count} documents, {failed_count} en erreur", file=sys.stderr)
+    metrics_dir = os.getenv("METRICS_DIR")
+    if metrics_dir and os.path.exists(os.path.join(metrics_dir, "traces.jsonl")):
+        # Histogrammes de toutes les traces, écrites par chacun des processus
+        with open(os.path.join(metrics_dir, "histograms.json"), "w", encoding="utf-8") as f:
+            json.dump(metrics.histograms_from_traces(os.path.join(metrics_dir, "traces.jsonl")), f, indent=2)
+    return done_count, failed_count
+
+
+def _write_records(finished, output, done_count, failed_count, store_records):
+    for future in finished:
+        record = future.result()
+        # Texte complet et pages : destinés à la base de résultats, pas au fichier JSONL
+        store_record = record.pop("store_record", None)
+        if store_record is not None:
+            store_records.append(store_record)
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        # flush à chaque ligne : un arrêt brutal ne perd que les documents en cours
+        output.flush()
+        done_count += 1
+        if "error" in record:
+            failed_count += 1
+            print(f"Erreur sur {record['path']}: {record['error']}", file=sys.stderr)
+    return done_count, failed_count
+
+
 # Exemple d'utilisation
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Analyseur de documents PPT & PDF")
+    parser.add_argument("--worker", action="store_true",
+                        help="pré-charge les modèles puis lit les chemins sur stdin (un par ligne)")
+    parser.add_argument("--socket", metavar="HOST:PORT",
+                        help="en mode worker, lit les chemins depuis une socket TCP plutôt que stdin")
+    parser.add_argument("--batch", metavar="SOURCE",
+                        help="analyse un dossier ou un manifeste (un chemin par ligne) avec un pool de processus")
+    parser.add_argument("--output", default="results.jsonl",
+                        help="fichier JSONL des résultats du mode batch (reprise automatique)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="nombre de processus du mode batch (par défaut : nombre de cœurs)")
+    parser.add_argument("--search", metavar="REQUÊTE",
+                        help="recherche plein texte (syntaxe FTS5) dans la base de résultats")
+    parser.add_argument("--similar", metavar="FICHIER",
+                        help="documents les plus proches d'un document déjà indexé (DOCUMENT_INDEX=1)")
+    parser.add_argument("--nprobe", type=int, default=None,
+                        help="groupes k-means parcourus par --similar (par défaut : tout l'index ; "
+                             "nécessite --build-index-clusters)")
+    parser.add_argument("--build-index-clusters", metavar="GROUPES", type=int, nargs="?", const=0, default=None,
+                        help="partitionne l'index de similarité (k-means, par défaut racine du nombre de "
+                             "documents) pour --nprobe ; à relancer quand l'index a beaucoup grossi")
+    parser.add_argument("--serve", metavar="HOST:PORT",
+                        help="lance le service HTTP d'analyse (file de jobs, voir analysis_service.py)")
+    parser.add_argument("--queue-size", type=int, default=32,
+                        help="taille de la file du service HTTP (au-delà : réponse 429)")
+    parser.add_argument("--ocr-concurrency", type=int, default=None,
+                        help="documents en extraction/OCR simultanément (par défaut : moitié des cœurs)")
+    parser.add_argument("--llm-concurrency", type=int, default=4,
+                        help="documents en attente de Mistral simultanément")
+    args = parser.parse_args()
+    # Progression des analyseurs (module logging) ; LOG_LEVEL=DEBUG détaille chaque page et chaque étape
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
+
+    if args.build_index_clusters is not None:
+        DocumentEmbeddingIndex().build_clusters(n_clusters=args.build_index_clusters or None)
+        if not args.similar:
+            sys.exit(0)
+
+    if args.similar:
+        index = DocumentEmbeddingIndex()
+        for match in index.similar(file_sha256(args.similar), k=10, nprobe=args.nprobe):
+            print(f"{match['score']:>8}  {match['path']}")
+        sys.exit(0)
+
+    if args.search:
+        for match in ResultStore().search(args.search):
+            print(f"{match['score']:>8}  {match['title']}  [{match['category']}]  {match['path']}")
+            print(f"          {match['snippet']}")
+        sys.exit(0)
+
+    if args.serve:
+        from analysis_service import serve_http
+        host, port = args.serve.rsplit(":", 1)
+        serve_http(host, int(port), ocr_concurrency=args.ocr_concurrency, llm_concurrency=args.llm_concurrency,
+                   queue_size=args.queue_size)
+        sys.exit(0)
+
+    if args.batch:
+        analyze_many(args.batch, args.output, args.workers)
+        sys.exit(0)
+
     analyzer = DocumentAnalyzer()
+
+    if args.worker:
+        with contextlib.redirect_stdout(sys.stderr):
+            analyzer.warm_up()
+        if args.socket:
+            host, port = args.socket.rsplit(":", 1)
+            serve_socket(analyzer, host, int(port))
+        else:
+            serve_stdin(analyzer)
+        sys.exit(0)
     
     # Demander le chemin du fichier à l'utilisateur
     file_path = input("Entrez le chemin du fichier à analyser : ")
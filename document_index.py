@@ -0,0 +1,240 @@
+"""Index de similarité des documents sur leurs embeddings MiniLM (ceux déjà calculés pour KeyBERT).
+
+Les vecteurs normalisés sont rangés dans une matrice float16 (ou float32) mappée en mémoire, à laquelle
+on ajoute des lignes au fil des analyses ; un index SQLite associe chaque ligne à l'identifiant du
+document (empreinte du contenu) et à son chemin. La recherche des k plus proches est un produit
+matriciel NumPy par blocs ; un pré-filtre k-means (build_clusters) limite le calcul aux groupes les plus
+proches de la requête pour les très gros index.
+"""
+import logging
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = os.path.join(
+    os.getenv("DOCUMENT_INDEX_DIR", os.path.join(os.path.expanduser("~"), ".cache", "poc_frd")),
+    "document_index",
+)
+# Lignes parcourues par produit matriciel : borne la mémoire temporaire d'une recherche
+SEARCH_BLOCK_ROWS = 262_144
+
+
+class DocumentEmbeddingIndex:
+    def __init__(self, directory=DEFAULT_INDEX_DIR, dtype=None, grow_rows=65536):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.grow_rows = grow_rows
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite"), timeout=30,
+                                     isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (row INTEGER PRIMARY KEY, doc_id TEXT NOT NULL UNIQUE,
+                                                  path TEXT);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+        # Le type est fixé à la création de l'index
+        dtype = dtype or os.getenv("DOCUMENT_INDEX_DTYPE", "float16")
+        self._conn.execute("INSERT OR IGNORE INTO meta VALUES ('dtype', ?)", (dtype,))
+        self.dtype = np.dtype(self._meta("dtype"))
+        dim = self._meta("dim")
+        self.dim = int(dim) if dim else None
+        self.vectors_path = os.path.join(directory, f"vectors.{self.dtype.name}")
+        self.clusters_path = os.path.join(directory, "clusters.i32")
+        self.centroids_path = os.path.join(directory, "centroids.npy")
+        self._vectors = None
+        self._mapped_rows = 0
+        self._centroids = None
+
+    def _meta(self, name):
+        row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def _map(self, rows_needed):
+        """(Re)map the vector file when it grew past what this process has mapped"""
+        if self._vectors is not None and self._mapped_rows >= rows_needed:
+            return
+        self._vectors = None
+        rows = os.path.getsize(self.vectors_path) // (self.dtype.itemsize * self.dim)
+        self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r+", shape=(rows, self.dim))
+        self._mapped_rows = rows
+
+    def _grow(self, path, rows, row_bytes):
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size < rows * row_bytes:
+            with open(path, "ab") as f:
+                f.truncate((rows + self.grow_rows) * row_bytes)
+
+    def add(self, doc_ids, embeddings, paths=None):
+        """Add (or replace) document embeddings; rows are normalized before being stored"""
+        if not doc_ids:
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(doc_ids), -1)
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True).clip(min=1e-12)
+        paths = paths or [None] * len(doc_ids)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self.dim is None:
+                    self._conn.execute("INSERT OR IGNORE INTO meta VALUES ('dim', ?)", (str(embeddings.shape[1]),))
+                    self.dim = int(self._meta("dim"))
+                next_row = self._conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM documents").fetchone()[0]
+                rows = []
+                for doc_id, path in zip(doc_ids, paths):
+                    existing = self._conn.execute("SELECT row FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+                    if existing:
+                        # Document déjà indexé : son vecteur est remplacé sur place
+                        rows.append(existing[0])
+                        self._conn.execute("UPDATE documents SET path = ? WHERE row = ?", (path, existing[0]))
+                    else:
+                        rows.append(next_row)
+                        self._conn.execute("INSERT INTO documents (row, doc_id, path) VALUES (?, ?, ?)",
+                                           (next_row, doc_id, path))
+                        next_row += 1
+                # Le fichier ne grandit que sous le verrou d'écriture SQLite : pas de course entre processus
+                self._grow(self.vectors_path, next_row, self.dtype.itemsize * self.dim)
+                self._map(next_row)
+                self._vectors[rows] = embeddings.astype(self.dtype)
+                self._vectors.flush()
+                centroids = self._load_centroids()
+                if centroids is not None:
+                    # Les nouveaux documents rejoignent le groupe k-means le plus proche
+                    self._grow(self.clusters_path, next_row, 4)
+                    assignments = np.memmap(self.clusters_path, dtype=np.int32, mode="r+")
+                    assignments[rows] = (embeddings @ centroids.T).argmax(axis=1)
+                    assignments.flush()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _count(self):
+        return self._conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM documents").fetchone()[0]
+
+    def _load_centroids(self):
+        if self._centroids is None and os.path.exists(self.centroids_path):
+            self._centroids = np.load(self.centroids_path)
+        return self._centroids
+
+    def get_vector(self, doc_id):
+        """Stored (normalized) embedding of a document, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT row FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+            if row is None:
+                return None
+            self._map(row[0] + 1)
+            return np.asarray(self._vectors[row[0]], dtype=np.float32)
+
+    def search(self, query, k=10, nprobe=None, exclude=()):
+        """Top-k documents by cosine similarity: [{"doc_id", "path", "score"}, ...].
+
+        nprobe: number of k-means groups to scan (needs build_clusters); None scans the whole matrix.
+        """
+        query = np.asarray(query, dtype=np.float32).ravel()
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            count = self._count()
+            if count == 0:
+                return []
+            self._map(count)
+            vectors = self._vectors[:count]
+            excluded_rows = set()
+            if exclude:
+                placeholders = ",".join("?" * len(exclude))
+                excluded_rows = {row for row, in self._conn.execute(
+                    f"SELECT row FROM documents WHERE doc_id IN ({placeholders})", list(exclude))}
+            wanted = k + len(excluded_rows)
+
+            centroids = self._load_centroids() if nprobe else None
+            if nprobe and centroids is None:
+                logger.warning("nprobe=%d ignoré : index non partitionné (python document_analyzer.py "
+                               "--build-index-clusters), recherche sur tout l'index", nprobe)
+            if centroids is not None:
+                # Pré-filtre : seuls les groupes dont le centroïde est le plus proche de la requête
+                groups = np.argsort(centroids @ query)[::-1][:nprobe]
+                assignments = np.memmap(self.clusters_path, dtype=np.int32, mode="r")[:count]
+                candidates = np.flatnonzero(np.isin(assignments, groups))
+                scores = vectors[candidates].astype(np.float32) @ query
+                top = _top_k(scores, wanted)
+                best_rows, best_scores = candidates[top], scores[top]
+            else:
+                best_rows, best_scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+                for start in range(0, count, SEARCH_BLOCK_ROWS):
+                    scores = vectors[start:start + SEARCH_BLOCK_ROWS].astype(np.float32) @ query
+                    top = _top_k(scores, wanted)
+                    # Fusion avec le meilleur des blocs précédents
+                    best_rows = np.concatenate([best_rows, top + start])
+                    best_scores = np.concatenate([best_scores, scores[top]])
+                    keep = _top_k(best_scores, wanted)
+                    best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+            order = np.argsort(-best_scores)
+            results = []
+            for row, score in zip(best_rows[order], best_scores[order]):
+                if int(row) in excluded_rows:
+                    continue
+                doc_id, path = self._conn.execute("SELECT doc_id, path FROM documents WHERE row = ?",
+                                                  (int(row),)).fetchone()
+                results.append({"doc_id": doc_id, "path": path, "score": round(float(score), 4)})
+                if len(results) == k:
+                    break
+            return results
+
+    def similar(self, doc_id, k=10, nprobe=None):
+        """Documents closest to an indexed document, without computing any new embedding"""
+        vector = self.get_vector(doc_id)
+        if vector is None:
+            return []
+        return self.search(vector, k, nprobe, exclude=(doc_id,))
+
+    def build_clusters(self, n_clusters=None, iterations=10, sample_size=100_000, seed=0):
+        """Spherical k-means over a sample of the index, then assign every document to its nearest group"""
+        with self._lock:
+            count = self._count()
+            if count == 0:
+                return
+            self._map(count)
+            vectors = self._vectors[:count]
+            n_clusters = min(count, n_clusters or max(1, int(np.sqrt(count))))
+            rng = np.random.default_rng(seed)
+            sample = vectors[np.sort(rng.choice(count, min(count, sample_size), replace=False))].astype(np.float32)
+            centroids = sample[rng.choice(len(sample), n_clusters, replace=False)]
+            for _ in range(iterations):
+                labels = (sample @ centroids.T).argmax(axis=1)
+                for cluster in range(n_clusters):
+                    members = sample[labels == cluster]
+                    if len(members):
+                        mean = members.mean(axis=0)
+                        centroids[cluster] = mean / (np.linalg.norm(mean) or 1.0)
+
+            self._grow(self.clusters_path, count, 4)
+            assignments = np.memmap(self.clusters_path, dtype=np.int32, mode="r+")
+            for start in range(0, count, SEARCH_BLOCK_ROWS):
+                block = vectors[start:start + SEARCH_BLOCK_ROWS].astype(np.float32)
+                assignments[start:start + len(block)] = (block @ centroids.T).argmax(axis=1)
+            assignments.flush()
+            tmp_path = f"{self.centroids_path}.{os.getpid()}.tmp.npy"
+            np.save(tmp_path, centroids)
+            os.replace(tmp_path, self.centroids_path)
+            self._centroids = centroids
+        logger.info(f"Index partitionné en {n_clusters} groupes ({count} documents)")
+
+    def close(self):
+        with self._lock:
+            self._vectors = None
+            self._conn.close()
+
+
+def _top_k(scores, k):
+    """Indices of the k highest scores (unordered), without sorting the whole array"""
+    if len(scores) <= k:
+        return np.arange(len(scores))
+    return np.argpartition(-scores, k)[:k]
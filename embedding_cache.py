@@ -0,0 +1,165 @@
+"""Cache des embeddings des n-grammes candidats de KeyBERT.
+
+Les mots et bigrammes d'un corpus se répètent d'un document à l'autre : chaque n-gramme n'est encodé
+qu'une fois par modèle. Cache en mémoire (LRU) devant un stockage disque partagé entre processus :
+une matrice float32 mappée en mémoire (vectors.f32) et un index SQLite n-gramme -> ligne.
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import metrics
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.getenv("NGRAM_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "poc_frd")),
+    "ngram_embeddings",
+)
+
+
+class NgramEmbeddingStore:
+    """Append-only on-disk store of n-gram embeddings for one model"""
+
+    def __init__(self, directory, grow_rows=65536):
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.grow_rows = grow_rows
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite"), timeout=30,
+                                     isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS ngrams (ngram TEXT PRIMARY KEY, row INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO meta VALUES ('next_row', 0);
+        """)
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self.dim = row[0] if row else None
+        self._vectors = None
+        self._mapped_rows = 0
+
+    def _map(self, rows_needed):
+        """(Re)map the vector file when it grew past what this process has mapped"""
+        if self._vectors is not None and self._mapped_rows >= rows_needed:
+            return
+        self._vectors = None  # libère l'ancien mapping avant d'en ouvrir un plus grand
+        rows = os.path.getsize(self.vectors_path) // (4 * self.dim)
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+        self._mapped_rows = rows
+
+    def get_many(self, ngrams):
+        """Return {ngram: vector} for the n-grams already stored"""
+        if self.dim is None or not ngrams:
+            return {}
+        with self._lock:
+            rows = {}
+            for start in range(0, len(ngrams), 500):  # limite de paramètres SQLite
+                batch = ngrams[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows.update(self._conn.execute(
+                    f"SELECT ngram, row FROM ngrams WHERE ngram IN ({placeholders})", batch
+                ).fetchall())
+            if not rows:
+                return {}
+            self._map(max(rows.values()) + 1)
+            return {ngram: np.array(self._vectors[row]) for ngram, row in rows.items()}
+
+    def put_many(self, ngrams, vectors):
+        """Append embeddings; n-grams stored concurrently by another process are simply ignored"""
+        if not ngrams:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self.dim is None:
+                    self._conn.execute("INSERT OR IGNORE INTO meta VALUES ('dim', ?)", (vectors.shape[1],))
+                    self.dim = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()[0]
+                start = self._conn.execute("SELECT value FROM meta WHERE name = 'next_row'").fetchone()[0]
+                self._conn.execute("UPDATE meta SET value = ? WHERE name = 'next_row'", (start + len(ngrams),))
+                # Le fichier ne grandit que sous le verrou d'écriture SQLite : pas de course entre processus
+                needed = (start + len(ngrams)) * 4 * self.dim
+                size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+                if size < needed:
+                    self._vectors = None
+                    with open(self.vectors_path, "ab") as f:
+                        f.truncate(needed + self.grow_rows * 4 * self.dim)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            # Les vecteurs sont écrits avant d'être indexés : un lecteur ne voit jamais une ligne vide
+            self._map(start + len(ngrams))
+            self._vectors[start:start + len(ngrams)] = vectors
+            self._vectors.flush()
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO ngrams (ngram, row) VALUES (?, ?)",
+                [(ngram, start + i) for i, ngram in enumerate(ngrams)],
+            )
+
+    def close(self):
+        with self._lock:
+            self._vectors = None
+            self._conn.close()
+
+
+class NgramEmbeddingCache:
+    """In-memory LRU in front of an NgramEmbeddingStore"""
+
+    def __init__(self, store, max_entries=50_000):
+        self.store = store
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, ngrams, compute):
+        """Embeddings of the n-grams, calling compute(list) only for the ones never seen"""
+        found = {}
+        with self._lock:
+            for ngram in ngrams:
+                vector = self._memory.get(ngram)
+                if vector is not None:
+                    self._memory.move_to_end(ngram)
+                    found[ngram] = vector
+        missing = [ngram for ngram in dict.fromkeys(ngrams) if ngram not in found]
+        from_disk = self.store.get_many(missing)
+        found.update(from_disk)
+        to_compute = [ngram for ngram in missing if ngram not in from_disk]
+        if to_compute:
+            computed = np.asarray(compute(to_compute), dtype=np.float32)
+            self.store.put_many(to_compute, computed)
+            found.update(zip(to_compute, computed))
+        self.hits += len(ngrams) - len(to_compute)
+        self.misses += len(to_compute)
+        metrics.annotate(ngram_cache_hits=len(ngrams) - len(to_compute), ngram_cache_misses=len(to_compute))
+        with self._lock:
+            for ngram in missing:
+                self._memory[ngram] = found[ngram]
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+        return np.stack([found[ngram] for ngram in ngrams])
+
+
+def cached_embedder(backend, cache, max_ngram_words=3):
+    """Wrap a KeyBERT embedding backend so that short strings (n-grams) go through the cache"""
+    from keybert.backend import BaseEmbedder  # import différé
+
+    class CachedEmbedder(BaseEmbedder):
+        def embed(self, documents, verbose=False):
+            documents = list(documents)
+            short = [doc for doc in documents if len(doc.split()) <= max_ngram_words]
+            # Les documents complets ne se répètent pas : seuls les n-grammes passent par le cache
+            if not short:
+                return backend.embed(documents, verbose)
+            if len(short) == len(documents):
+                return cache.embed(documents, lambda missing: backend.embed(missing, verbose))
+            long_docs = [doc for doc in documents if len(doc.split()) > max_ngram_words]
+            long_vectors = dict(zip(long_docs, backend.embed(long_docs, verbose)))
+            short_vectors = dict(zip(short, cache.embed(short, lambda missing: backend.embed(missing, verbose))))
+            return np.stack([short_vectors.get(doc, long_vectors.get(doc)) for doc in documents])
+
+    return CachedEmbedder()
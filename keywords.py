@@ -0,0 +1,75 @@
+"""Extraction de mots-clés KeyBERT par lots : les documents et tous leurs n-grammes candidats
+sont encodés en gros lots, au lieu d'un petit encodage par document"""
+import numpy as np
+
+import metrics
+import model_registry
+from text_chunking import iter_chunks, sample_evenly, tokenizer_counter
+
+# MiniLM tronque ses entrées à 256 tokens : les documents sont encodés par morceaux de cette taille
+DOC_CHUNK_TOKENS = 200
+MAX_DOC_CHUNKS = 16
+
+
+def doc_token_counter():
+    """Exact token counter of the MiniLM tokenizer, for chunks that fit its 256-token context"""
+    return tokenizer_counter(f"sentence-transformers/{model_registry.DEFAULT_KEYWORD_MODEL}")
+
+
+def embed_documents(model, docs, max_tokens=DOC_CHUNK_TOKENS, max_chunks=MAX_DOC_CHUNKS):
+    """Embeddings covering each whole document: normalized mean of the embeddings of its chunks"""
+    chunked = []
+    for doc in docs:
+        chunked.append(sample_evenly(list(iter_chunks(doc, max_tokens)) or [doc], max_chunks))
+    # Un seul appel d'encodage pour les morceaux de tous les documents
+    vectors = np.asarray(model.model.embed([chunk for chunks in chunked for chunk in chunks]))
+    embeddings, start = [], 0
+    for chunks in chunked:
+        mean = vectors[start:start + len(chunks)].mean(axis=0)
+        embeddings.append(mean / (np.linalg.norm(mean) or 1.0))
+        start += len(chunks)
+    return np.vstack(embeddings)
+
+
+def extract_keywords_batch(texts, keyphrase_ngram_range=(1, 1), top_n=10, use_maxsum=True,
+                           nr_candidates=20, model=None, return_embeddings=False):
+    """Return, for each text, its [(keyword, score), ...] list (empty for empty texts).
+
+    With return_embeddings, also return the document embeddings (one row per text, zeros for empty texts).
+    """
+    from sklearn.feature_extraction.text import CountVectorizer  # dépendance de KeyBERT
+
+    model = model or model_registry.get_keyword_model()
+    results = [[] for _ in texts]
+    indices = [i for i, text in enumerate(texts) if text and text.strip()]
+    if not indices:
+        return (results, None) if return_embeddings else results
+
+    docs = [texts[i] for i in indices]
+    with metrics.span("keywords", documents=len(docs), chars=sum(len(doc) for doc in docs)) as attrs:
+        # Vocabulaire candidat commun à tous les documents, encodé en un seul lot
+        vectorizer = CountVectorizer(ngram_range=keyphrase_ngram_range, stop_words="english", min_df=1).fit(docs)
+        candidates = list(vectorizer.get_feature_names_out())
+        attrs["candidates"] = len(candidates)
+        word_embeddings = model.model.embed(candidates)
+        doc_embeddings = embed_documents(model, docs)
+        keywords = model.extract_keywords(
+            docs,
+            top_n=top_n,
+            use_maxsum=use_maxsum,
+            nr_candidates=nr_candidates,
+            vectorizer=vectorizer,
+            doc_embeddings=doc_embeddings,
+            word_embeddings=word_embeddings,
+        )
+    # KeyBERT renvoie directement la liste de mots-clés quand il n'y a qu'un document
+    if len(docs) == 1:
+        keywords = [keywords]
+    for i, doc_keywords in zip(indices, keywords):
+        results[i] = doc_keywords
+    if not return_embeddings:
+        return results
+    # Les embeddings des documents servent aussi au classement (voir classification)
+    embeddings = np.zeros((len(texts), doc_embeddings.shape[1]), dtype=np.float32)
+    embeddings[indices] = doc_embeddings
+    return results, embeddings
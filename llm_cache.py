@@ -0,0 +1,137 @@
+"""Cache des réponses Mistral : clé = modèle + messages + paramètres, avec TTL, taille bornée
+et fusion des requêtes identiques en cours (une seule vraie requête, les autres attendent)"""
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import metrics
+from content_hash import text_sha256
+
+
+class _CachedChat:
+    """Mimics client.chat so the wrapper is a drop-in replacement"""
+
+    def __init__(self, owner):
+        self._owner = owner
+
+    def complete(self, **kwargs):
+        return self._owner.complete(**kwargs)
+
+    async def complete_async(self, **kwargs):
+        return await self._owner.complete_async(**kwargs)
+
+
+class CachedChatClient:
+    def __init__(self, client, ttl=24 * 3600, max_entries=1024):
+        # client : n'importe quel objet exposant client.chat.complete(**kwargs) (Mistral ou stub local)
+        self.client = client
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.chat = _CachedChat(self)
+        self._entries = OrderedDict()  # clé -> (date d'expiration, réponse)
+        self._in_flight = {}  # clé -> Future partagé par les appels identiques
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.merged = 0
+
+    def __getattr__(self, name):
+        # Tout ce qui n'est pas mis en cache est délégué au vrai client
+        return getattr(self.client, name)
+
+    @staticmethod
+    def make_key(kwargs):
+        """Stable key for a completion request (model, messages and every other parameter)"""
+        return text_sha256(json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str))
+
+    def _lookup(self, key):
+        """Return (response, future, is_leader); must be called with the lock held"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], None, False
+            del self._entries[key]
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.merged += 1
+            return None, future, False
+        future = Future()
+        self._in_flight[key] = future
+        self.misses += 1
+        return None, future, True
+
+    def _store(self, key, response):
+        """Keep a response and drop the least recently used ones; lock must be held"""
+        self._entries[key] = (time.monotonic() + self.ttl, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def complete(self, **kwargs):
+        """Cached equivalent of client.chat.complete"""
+        key = self.make_key(kwargs)
+        with self._lock:
+            response, future, is_leader = self._lookup(key)
+        metrics.annotate(cache_hit=response is not None, cache_merged=response is None and not is_leader)
+        if response is not None:
+            return response
+        if not is_leader:
+            # Une requête identique est déjà en cours : on attend son résultat
+            return future.result()
+
+        try:
+            response = self.client.chat.complete(**kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, response=response)
+        return response
+
+    async def complete_async(self, before_call=None, **kwargs):
+        """Cached equivalent of client.chat.complete_async (falls back to a thread for sync clients).
+
+        before_call: coroutine function awaited only before a real upstream call (rate limiter), never
+        for cache hits or requests merged into an identical one in flight.
+        """
+        key = self.make_key(kwargs)
+        with self._lock:
+            response, future, is_leader = self._lookup(key)
+        metrics.annotate(cache_hit=response is not None, cache_merged=response is None and not is_leader)
+        if response is not None:
+            return response
+        if not is_leader:
+            return await asyncio.wrap_future(future)
+
+        chat = self.client.chat
+        try:
+            if before_call is not None:
+                await before_call()
+            if hasattr(chat, "complete_async"):
+                response = await chat.complete_async(**kwargs)
+            else:
+                response = await asyncio.to_thread(chat.complete, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, response=response)
+        return response
+
+    def _finish(self, key, future, response=None, error=None):
+        """Publish the outcome of the leading call to the merged callers"""
+        with self._lock:
+            if error is None:
+                self._store(key, response)
+            del self._in_flight[key]
+        if error is None:
+            future.set_result(response)
+        else:
+            future.set_exception(error)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,179 @@
+"""Étape LLM asynchrone : les prompts indépendants d'un ou plusieurs documents partent en parallèle,
+dans la limite d'un débit en requêtes/seconde et en tokens/minute (token bucket)"""
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+
+import metrics
+import model_registry
+from llm_cache import CachedChatClient
+
+
+def estimate_tokens(kwargs):
+    """Rough token count of a request (about 4 characters per token, plus the reply budget)"""
+    chars = sum(len(str(message.get("content", ""))) for message in kwargs.get("messages", []))
+    return chars // 4 + kwargs.get("max_tokens", 256)
+
+
+def parse_json_fields(content, fields):
+    """Parse a JSON object reply holding the given text fields; returns None if it does not match"""
+    if not isinstance(content, str):
+        return None
+    content = content.strip()
+    # Certains modèles entourent le JSON d'un bloc de code markdown
+    if content.startswith("```"):
+        content = content.strip("`")
+        if content.lower().startswith("json"):
+            content = content[4:]
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    parsed = {}
+    for field in fields:
+        value = data.get(field)
+        if isinstance(value, list) and all(isinstance(item, str) for item in value):
+            value = "\n".join(value)
+        if not isinstance(value, str):
+            return None
+        parsed[field] = value.strip()
+    return parsed
+
+
+class RateLimiter:
+    """Token bucket on two budgets: requests per second and tokens per minute"""
+
+    def __init__(self, requests_per_second=1.0, tokens_per_minute=500_000):
+        self.requests_per_second = requests_per_second
+        self.tokens_per_second = tokens_per_minute / 60.0
+        self.request_capacity = max(1.0, requests_per_second)
+        self.token_capacity = float(tokens_per_minute)
+        self._requests = self.request_capacity
+        self._tokens = self.token_capacity
+        self._updated = time.monotonic()
+        # Verrou de thread : le limiteur est partagé par des boucles asyncio de threads différents
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens):
+        """Reserve capacity for one request and return how long to wait before sending it"""
+        tokens = min(tokens, self.token_capacity)
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated
+            self._updated = now
+            self._requests = min(self.request_capacity, self._requests + elapsed * self.requests_per_second)
+            self._tokens = min(self.token_capacity, self._tokens + elapsed * self.tokens_per_second)
+            wait = max(
+                0.0,
+                (1 - self._requests) / self.requests_per_second,
+                (tokens - self._tokens) / self.tokens_per_second,
+            )
+            # Les soldes peuvent devenir négatifs : c'est la réservation des appels en attente
+            self._requests -= 1
+            self._tokens -= tokens
+            return wait
+
+    async def acquire(self, tokens):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class LLMStage:
+    def __init__(self, client=None, limiter=None, max_concurrency=8):
+        self._client = client
+        self.limiter = limiter or RateLimiter(
+            requests_per_second=float(os.getenv("MISTRAL_REQUESTS_PER_SECOND", 1)),
+            tokens_per_minute=float(os.getenv("MISTRAL_TOKENS_PER_MINUTE", 500_000)),
+        )
+        self.max_concurrency = max_concurrency
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    @property
+    def client(self):
+        return self._client or model_registry.get_mistral_client()
+
+    async def complete(self, semaphore, **kwargs):
+        """Send one chat completion once the limiter allows it; returns the message content"""
+        tokens = estimate_tokens(kwargs)
+        async with semaphore:
+            with metrics.span("llm", model=kwargs.get("model"), prompt_tokens_estimate=tokens,
+                              rate_limit_wait_ms=0.0) as attrs:
+                async def wait_for_limiter():
+                    queued = time.monotonic()
+                    await self.limiter.acquire(tokens)
+                    attrs["rate_limit_wait_ms"] = round((time.monotonic() - queued) * 1000, 1)
+
+                client = self.client
+                if isinstance(client, CachedChatClient):
+                    # Le débit n'est réservé que pour un vrai appel : ni les réponses du cache
+                    # ni les requêtes fusionnées avec un appel identique en cours ne l'entament
+                    response = await client.complete_async(before_call=wait_for_limiter, **kwargs)
+                else:
+                    await wait_for_limiter()
+                    if hasattr(client.chat, "complete_async"):
+                        response = await client.chat.complete_async(**kwargs)
+                    else:
+                        response = await asyncio.to_thread(client.chat.complete, **kwargs)
+                # Consommation réelle quand l'API la renvoie (une réponse du cache n'a rien consommé)
+                usage = getattr(response, "usage", None)
+                if usage is not None and not (attrs.get("cache_hit") or attrs.get("cache_merged")):
+                    attrs["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+                    attrs["completion_tokens"] = getattr(usage, "completion_tokens", None)
+        return response.choices[0].message.content
+
+    async def _run_one(self, semaphore, kwargs):
+        # Une erreur sur un prompt ne doit pas annuler les autres
+        try:
+            return await self.complete(semaphore, **kwargs)
+        except Exception as e:
+            return e
+
+    async def run_many_async(self, batches):
+        """Run every request of every document concurrently; keeps the {name: ...} shape of each batch"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        jobs = [(i, name, kwargs) for i, requests in enumerate(batches) for name, kwargs in requests.items()]
+        outputs = await asyncio.gather(*(self._run_one(semaphore, kwargs) for _, _, kwargs in jobs))
+        results = [{} for _ in batches]
+        for (i, name, _), output in zip(jobs, outputs):
+            results[i][name] = output
+        return results
+
+    def run(self, requests):
+        """Run one document's requests ({name: completion kwargs}); failed calls come back as exceptions"""
+        return self.run_many([requests])[0]
+
+    def run_many(self, batches):
+        """Synchronous entry point for a list of documents' requests"""
+        # Toujours la même boucle : le client asynchrone garde ses connexions persistantes d'un document
+        # à l'autre, et elles ne sont utilisables que depuis la boucle qui les a ouvertes
+        future = asyncio.run_coroutine_threadsafe(
+            self._in_context(contextvars.copy_context(), self.run_many_async(batches)), self._event_loop()
+        )
+        return future.result()
+
+    def _event_loop(self):
+        """Event loop of the stage, running for the whole process in a dedicated thread"""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="llm-stage", daemon=True).start()
+            return self._loop
+
+    @staticmethod
+    async def _in_context(context, coroutine):
+        # Les spans LLM restent rattachés à la trace du document appelant (metrics, contextvars)
+        for variable, value in context.items():
+            variable.set(value)
+        return await coroutine
+
+
+def get_llm_stage():
+    """Shared LLM stage, so that the rate limit holds for the whole process"""
+    return model_registry.get_model(("llm_stage",), LLMStage)
@@ -0,0 +1,96 @@
+"""Résumé local, sans appel réseau : petit modèle seq2seq quantifié en int8 pour le CPU.
+
+Sert de solution de repli quand Mistral ne répond pas, et de résumeur pour lecture.py. Le décodage est
+glouton (ou à faisceau étroit), tous les morceaux passent dans un seul appel generate, et un budget de
+temps par document borne le coût : au-delà, on garde ce qui a été produit.
+"""
+import logging
+import os
+import time
+
+import model_registry
+from text_chunking import iter_chunks, sample_evenly, tokenizer_counter
+
+logger = logging.getLogger(__name__)
+
+# Modèle BARThez affiné sur OrangeSum (résumés en français), ~165M paramètres
+DEFAULT_LOCAL_SUMMARY_MODEL = "moussaKam/barthez-orangesum-abstract"
+INPUT_TOKENS = 512
+MAX_CHUNKS = 8
+MAX_NEW_TOKENS = 96
+
+
+def get_local_summarizer(model_name=None):
+    """Shared (tokenizer, model) pair; the model's linear layers are quantized to int8 once, at load time"""
+    model_name = model_name or os.getenv("LOCAL_SUMMARY_MODEL", DEFAULT_LOCAL_SUMMARY_MODEL)
+
+    def load():
+        import torch
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_name).eval()
+        # Quantification dynamique : poids int8, activations quantifiées à la volée (CPU uniquement)
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return tokenizer, model
+    return model_registry.get_model(("local_summarizer", model_name, "int8"), load)
+
+
+def _generate(tokenizer, model, texts, num_beams, max_new_tokens, max_time):
+    import torch
+    inputs = tokenizer(texts, padding=True, truncation=True, max_length=INPUT_TOKENS, return_tensors="pt")
+    with torch.inference_mode():
+        outputs = model.generate(
+            **inputs,
+            num_beams=num_beams,
+            do_sample=False,
+            max_new_tokens=max_new_tokens,
+            no_repeat_ngram_size=3,
+            early_stopping=num_beams > 1,
+            # Arrête la génération du lot quand le budget est écoulé (sorties partielles conservées)
+            max_time=max(max_time, 0.1),
+        )
+    return [summary.strip() for summary in tokenizer.batch_decode(outputs, skip_special_tokens=True)]
+
+
+def summarize(text, budget_seconds=None, num_beams=None, max_chunks=MAX_CHUNKS, model_name=None):
+    """Summary of the whole text within budget_seconds (LOCAL_SUMMARY_BUDGET, 30 s by default)"""
+    budget_seconds = budget_seconds or float(os.getenv("LOCAL_SUMMARY_BUDGET", 30))
+    num_beams = num_beams or int(os.getenv("LOCAL_SUMMARY_BEAMS", 1))
+    model_name = model_name or os.getenv("LOCAL_SUMMARY_MODEL", DEFAULT_LOCAL_SUMMARY_MODEL)
+    tokenizer, model = get_local_summarizer(model_name)
+    count_tokens = tokenizer_counter(model_name)
+    # Le budget démarre une fois le modèle et le tokenizer chargés : un premier appel (téléchargement,
+    # quantification) ne doit pas le consommer
+    start = time.monotonic()
+
+    chunks = list(iter_chunks(text, INPUT_TOKENS - 16, count_tokens=count_tokens))
+    if not chunks:
+        return ""
+    chunks = sample_evenly(chunks, max_chunks)
+    logger.info(f"Local summary over {len(chunks)} chunks (budget {budget_seconds:.0f} s)...")
+
+    # Map : tous les morceaux en un seul lot, avec la plus grande part du budget
+    remaining = budget_seconds - (time.monotonic() - start)
+    partial_summaries = [summary for summary in
+                         _generate(tokenizer, model, chunks, num_beams, MAX_NEW_TOKENS, remaining * 0.7) if summary]
+    if len(partial_summaries) <= 1:
+        return partial_summaries[0] if partial_summaries else ""
+
+    # Reduce : un résumé des résumés partiels, s'il reste du temps ; sinon on les concatène
+    remaining = budget_seconds - (time.monotonic() - start)
+    if remaining < 1:
+        logger.warning("Local summary budget exhausted, returning partial summaries")
+        return " ".join(partial_summaries)
+    return _generate(tokenizer, model, [" ".join(partial_summaries)], num_beams, MAX_NEW_TOKENS * 2, remaining)[0]
+
+
+def fill_missing_summary(fields, text):
+    """Fallback when the Mistral summary failed: summarize locally (LOCAL_SUMMARY_FALLBACK=0 disables it)"""
+    if fields is None or fields.get("summary") or not text.strip() or os.getenv("LOCAL_SUMMARY_FALLBACK", "1") == "0":
+        return fields
+    logger.warning("No summary from Mistral, falling back to the local summarizer")
+    try:
+        fields["summary"] = summarize(text)
+    except Exception as e:
+        logger.error(f"Error generating local summary: {str(e)}")
+    return fields
@@ -0,0 +1,202 @@
+"""Mesures par étape : durées, volumes traités (octets, pages, tokens) et succès de cache.
+
+Chaque étape est entourée d'un span :
+
+    with metrics.span("ocr_page", page=3) as attrs:
+        ...
+        attrs["chars"] = len(text)
+
+Les spans alimentent des histogrammes agrégés par étape (metrics.histograms()) et, à l'intérieur de
+metrics.trace_document(path), la trace JSON du document. Avec METRICS_DIR, chaque trace est ajoutée à
+METRICS_DIR/traces.jsonl ; `python metrics.py traces.jsonl` en tire les histogrammes.
+"""
+import bisect
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+# Bornes des histogrammes, en millisecondes
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1_000, 2_000, 5_000, 10_000, 20_000, 60_000]
+# Durées gardées par étape pour les percentiles exacts
+RECENT_DURATIONS = 10_000
+
+_current_trace = contextvars.ContextVar("metrics_trace", default=None)
+_current_span = contextvars.ContextVar("metrics_span", default=None)
+
+
+class StageStats:
+    """Aggregate of one stage: count, duration histogram and summed numeric attributes"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.recent = deque(maxlen=RECENT_DURATIONS)
+        self.totals = {}
+
+    def add(self, duration_ms, attrs):
+        self.count += 1
+        self.total_ms += duration_ms
+        self.buckets[bisect.bisect_left(BUCKETS_MS, duration_ms)] += 1
+        self.recent.append(duration_ms)
+        for name, value in attrs.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if isinstance(value, (int, float)):
+                self.totals[name] = self.totals.get(name, 0) + value
+
+    def summary(self):
+        durations = sorted(self.recent)
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 1),
+            "mean_ms": round(self.total_ms / self.count, 1) if self.count else 0.0,
+            "p50_ms": round(percentile(durations, 50), 1),
+            "p95_ms": round(percentile(durations, 95), 1),
+            "p99_ms": round(percentile(durations, 99), 1),
+            "buckets": {
+                (f"<={bound}ms" if bound is not None else f">{BUCKETS_MS[-1]}ms"): count
+                for bound, count in zip(BUCKETS_MS + [None], self.buckets) if count
+            },
+            "totals": self.totals,
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, duration_ms, attrs):
+        with self._lock:
+            self._stages.setdefault(stage, StageStats()).add(duration_ms, attrs)
+
+    def histograms(self):
+        with self._lock:
+            return {stage: stats.summary() for stage, stats in sorted(self._stages.items())}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+
+registry = MetricsRegistry()
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+@contextlib.contextmanager
+def span(stage, **attrs):
+    """Time a stage; the yielded dict collects attributes (bytes, pages, tokens, cache hits...)"""
+    token = _current_span.set(attrs)
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        _current_span.reset(token)
+        registry.record(stage, duration_ms, attrs)
+        trace = _current_trace.get()
+        if trace is not None:
+            with trace["lock"]:
+                trace["spans"].append({"stage": stage, "start_ms": round((start - trace["start"]) * 1000, 1),
+                                       "duration_ms": round(duration_ms, 1), **attrs})
+
+
+def annotate(**attrs):
+    """Add attributes to the innermost open span of the current context (no-op outside a span)"""
+    current = _current_span.get()
+    if current is not None:
+        current.update(attrs)
+
+
+@contextlib.contextmanager
+def trace_document(path):
+    """Collect the spans of one document analysis into a trace record, exported when METRICS_DIR is set"""
+    if _current_trace.get() is not None:
+        # Trace déjà ouverte (appel imbriqué) : les spans y sont ajoutés
+        yield _current_trace.get()
+        return
+    trace = {"document": os.path.abspath(path), "start": time.perf_counter(), "spans": [],
+             "lock": threading.Lock()}
+    token = _current_trace.set(trace)
+    started_at = time.time()
+    status = "ok"
+    try:
+        with span("document", bytes=os.path.getsize(path) if os.path.exists(path) else 0):
+            yield trace
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        _current_trace.reset(token)
+        document_span = trace["spans"][-1]
+        record = {
+            "document": trace["document"],
+            "started_at": started_at,
+            "status": status,
+            "duration_ms": document_span["duration_ms"],
+            "bytes": document_span.get("bytes"),
+            "spans": trace["spans"][:-1],
+        }
+        trace["record"] = record
+        export_trace(record)
+
+
+_export_lock = threading.Lock()
+
+
+def export_trace(record, directory=None):
+    """Append a trace record to METRICS_DIR/traces.jsonl (one line per document)"""
+    directory = directory or os.getenv("METRICS_DIR")
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    # Une seule écriture en mode ajout : les lignes de plusieurs processus ne s'entremêlent pas
+    with _export_lock, open(os.path.join(directory, "traces.jsonl"), "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+def histograms():
+    """Aggregate per-stage histograms of this process"""
+    return registry.histograms()
+
+
+def histograms_from_traces(path):
+    """Aggregate histograms from a traces.jsonl file (e.g. written by several batch workers)"""
+    aggregate = MetricsRegistry()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            aggregate.record("document", record["duration_ms"], {})
+            for recorded in record["spans"]:
+                attrs = {key: value for key, value in recorded.items()
+                         if key not in ("stage", "start_ms", "duration_ms")}
+                aggregate.record(recorded["stage"], recorded["duration_ms"], attrs)
+    return aggregate.histograms()
+
+
+def submit_in_context(pool, function, *args):
+    """pool.submit that keeps the current trace, so that spans recorded in worker threads are not lost"""
+    return pool.submit(contextvars.copy_context().run, function, *args)
+
+
+if __name__ == "__main__":
+    print(json.dumps(histograms_from_traces(sys.argv[1]), indent=2, ensure_ascii=False))
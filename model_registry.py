@@ -0,0 +1,112 @@
+"""Registre des modèles partagés : chaque modèle est chargé une seule fois par processus,
+au premier usage, puis la même instance est fournie à tous les analyseurs."""
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+_models = {}
+_locks = {}
+_locks_guard = threading.Lock()
+
+DEFAULT_KEYWORD_MODEL = "all-MiniLM-L6-v2"
+
+
+def _lock_for(key):
+    with _locks_guard:
+        if key not in _locks:
+            _locks[key] = threading.Lock()
+        return _locks[key]
+
+
+def get_model(key, loader):
+    """Return the shared instance for key, calling loader() on first use"""
+    model = _models.get(key)
+    if model is not None:
+        return model
+    # Un verrou par clé : deux modèles différents peuvent se charger en parallèle
+    with _lock_for(key):
+        model = _models.get(key)
+        if model is None:
+            logger.info(f"Loading model {'/'.join(key)}...")
+            model = loader()
+            _models[key] = model
+    return model
+
+
+def is_loaded(key):
+    """Tell whether a model has already been loaded in this process"""
+    return key in _models
+
+
+def clear():
+    """Drop every loaded model (tests, or to release memory)"""
+    _models.clear()
+
+
+def get_device():
+    """Return "cuda" when a GPU is available, "cpu" otherwise"""
+    def load():
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return get_model(("device",), load)
+
+
+def get_keyword_model(model_name=DEFAULT_KEYWORD_MODEL, backend=None):
+    """Shared KeyBERT instance for the given embedding model.
+
+    backend: "torch" (default), "onnx", or "onnx-int8" for the quantized ONNX export (CPU);
+    defaults to the KEYWORD_BACKEND environment variable.
+    """
+    backend = backend or os.getenv("KEYWORD_BACKEND", "torch")
+
+    def load():
+        from keybert import KeyBERT
+        from keybert.backend._utils import select_backend
+        if backend == "torch":
+            embedding_model = model_name
+        else:
+            from sentence_transformers import SentenceTransformer
+            model_kwargs = {}
+            if backend == "onnx-int8":
+                # Export quantifié int8 publié avec les modèles sentence-transformers
+                model_kwargs["file_name"] = os.getenv("KEYWORD_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+            elif backend != "onnx":
+                raise ValueError(f"Backend d'embedding inconnu : {backend}")
+            embedding_model = SentenceTransformer(model_name, backend="onnx", model_kwargs=model_kwargs)
+        embedder = select_backend(embedding_model)
+        if os.getenv("NGRAM_CACHE", "1") != "0":
+            # Les n-grammes candidats déjà vus ne sont plus réencodés (cache mémoire + disque)
+            from embedding_cache import DEFAULT_CACHE_DIR, NgramEmbeddingCache, NgramEmbeddingStore, cached_embedder
+            store = NgramEmbeddingStore(os.path.join(DEFAULT_CACHE_DIR, f"{model_name}-{backend}".replace("/", "_")))
+            embedder = cached_embedder(embedder, NgramEmbeddingCache(store))
+        return KeyBERT(model=embedder)
+    return get_model(("keybert", model_name, backend), load)
+
+
+def get_mistral_client():
+    """Shared Mistral client, configured from MISTRAL_API_KEY, with cached completions"""
+    def load():
+        from mistralai import Mistral
+        from llm_cache import CachedChatClient
+        options = {"api_key": os.getenv("MISTRAL_API_KEY")}
+        # Autre point d'accès (proxy, ou faux serveur local du banc de mesure)
+        if os.getenv("MISTRAL_SERVER_URL"):
+            options["server_url"] = os.getenv("MISTRAL_SERVER_URL")
+        return CachedChatClient(
+            Mistral(**options),
+            ttl=int(os.getenv("LLM_CACHE_TTL", 24 * 3600)),
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1024)),
+        )
+    return get_model(("mistral",), load)
+
+
+def get_pipeline(task, model, **kwargs):
+    """Shared transformers pipeline for (task, model) and its options (device, dtype...)"""
+    def load():
+        from transformers import pipeline
+        return pipeline(task, model=model, **kwargs)
+    # Le jeton d'accès ne change pas le modèle chargé (et ne doit pas apparaître dans les messages)
+    options = tuple(f"{name}={value}" for name, value in sorted(kwargs.items()) if name != "token")
+    return get_model(("pipeline", task, model) + options, load)
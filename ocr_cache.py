@@ -0,0 +1,181 @@
+"""Cache disque du texte OCR par page, partagé entre processus (SQLite en mode WAL)"""
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from content_hash import text_sha256
+from page_filter import HASH_BYTES, hamming_distances
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.getenv("OCR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "poc_frd")),
+    "ocr_cache.sqlite",
+)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class OCRCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Une connexion par instance ; le verrou protège les appels depuis plusieurs threads,
+        # SQLite (WAL + busy timeout) gère les accès concurrents entre processus
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS ocr_pages (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ocr_pages_last_access ON ocr_pages (last_access);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO meta VALUES ('total_size', 0);
+            INSERT OR IGNORE INTO meta VALUES ('removed_pages', 0);
+        """)
+        # Colonnes ajoutées aux caches existants : langue choisie pour la page (sélection automatique),
+        # hash perceptuel de la page (recherche des quasi-doublons, voir page_filter) et réglage OCR
+        # (langue, configuration Tesseract, dpi) : un quasi-doublon n'est repris que pour le même réglage
+        for column in ("language TEXT", "dhash BLOB", "setup TEXT"):
+            try:
+                self._conn.execute(f"ALTER TABLE ocr_pages ADD COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass  # colonne déjà présente
+        # Hashes perceptuels chargés en mémoire, par réglage OCR : complétés au fil des ajouts (y compris
+        # d'autres processus), rechargés entièrement après une éviction ou un remplacement (removed_pages)
+        self._dhash_rowid = 0
+        self._dhash_removed = None
+        self._dhash_setups = {}
+
+    @staticmethod
+    def make_key(content_hash, page_number, language, config, dpi):
+        """Build the cache key of one page for a given Tesseract setup"""
+        return text_sha256(content_hash, page_number, language, config, dpi)
+
+    @staticmethod
+    def make_setup(language, config, dpi):
+        """Identify a Tesseract setup (the key without the document and page), stored with perceptual hashes"""
+        return text_sha256(language, config, dpi)
+
+    def get(self, key):
+        """Return the cached text, or None on a miss"""
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def get_entry(self, key):
+        """Return (text, OCR language) of a cached page, or None on a miss"""
+        with self._lock:
+            row = self._conn.execute("SELECT text, language FROM ocr_pages WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE ocr_pages SET last_access = ? WHERE key = ?", (time.time(), key))
+            return row
+
+    def find_similar(self, page_hash, max_distance, setup):
+        """(text, OCR language) of the closest cached page OCRed with the same setup, or None beyond max_distance"""
+        with self._lock:
+            self._load_dhashes()
+            if setup not in self._dhash_setups:
+                return None
+            rowids, hashes = self._dhash_setups[setup]
+            distances = hamming_distances(hashes, page_hash)
+            # Du plus proche au plus lointain sous le seuil : une page évincée ou remplacée par un autre
+            # processus depuis le dernier chargement est passée
+            for index in np.argsort(distances, kind="stable"):
+                if distances[index] > max_distance:
+                    break
+                row = self._conn.execute("SELECT text, language FROM ocr_pages WHERE rowid = ? AND dhash = ?",
+                                         (int(rowids[index]), hashes[index].tobytes())).fetchone()
+                if row is not None:
+                    self._conn.execute("UPDATE ocr_pages SET last_access = ? WHERE rowid = ?",
+                                       (time.time(), int(rowids[index])))
+                    return row
+            return None
+
+    def _load_dhashes(self):
+        """Bring the in-memory perceptual hashes up to date with the table (caller holds the lock)"""
+        removed = self._conn.execute("SELECT value FROM meta WHERE name = 'removed_pages'").fetchone()[0]
+        if removed != self._dhash_removed:
+            # Pages évincées ou remplacées depuis le dernier chargement : on repart de zéro
+            self._dhash_removed = removed
+            self._dhash_rowid = 0
+            self._dhash_setups = {}
+        rows = self._conn.execute(
+            "SELECT rowid, setup, dhash FROM ocr_pages "
+            "WHERE rowid > ? AND setup IS NOT NULL AND length(dhash) = ? ORDER BY rowid",
+            (self._dhash_rowid, HASH_BYTES),
+        ).fetchall()
+        if not rows:
+            return
+        self._dhash_rowid = rows[-1][0]
+        new_rows = {}
+        for rowid, setup, dhash in rows:
+            new_rows.setdefault(setup, []).append((rowid, dhash))
+        for setup, entries in new_rows.items():
+            rowids = np.array([rowid for rowid, _ in entries], dtype=np.int64)
+            hashes = np.frombuffer(b"".join(dhash for _, dhash in entries), dtype=np.uint8).reshape(len(entries), -1)
+            if setup in self._dhash_setups:
+                old_rowids, old_hashes = self._dhash_setups[setup]
+                rowids, hashes = np.concatenate([old_rowids, rowids]), np.vstack([old_hashes, hashes])
+            self._dhash_setups[setup] = (rowids, hashes)
+
+    def put(self, key, text, language=None, dhash=None, setup=None):
+        """Store a page text, its OCR language and perceptual hash; evicts least recently used pages above max_bytes"""
+        size = len(text.encode("utf-8"))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT size FROM ocr_pages WHERE key = ?", (key,)).fetchone()
+                old_size = row[0] if row else 0
+                if row:
+                    self._add_removed(1)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO ocr_pages (key, text, size, last_access, language, dhash, setup) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, text, size, time.time(), language, dhash, setup),
+                )
+                total = self._add_to_total(size - old_size)
+                if total > self.max_bytes:
+                    self._evict(total)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _add_to_total(self, delta):
+        self._conn.execute("UPDATE meta SET value = value + ? WHERE name = 'total_size'", (delta,))
+        return self._conn.execute("SELECT value FROM meta WHERE name = 'total_size'").fetchone()[0]
+
+    def _add_removed(self, count):
+        # Compteur des pages supprimées ou remplacées : invalide les hashes chargés par chaque processus
+        self._conn.execute("UPDATE meta SET value = value + ? WHERE name = 'removed_pages'", (count,))
+
+    def _evict(self, total):
+        """Delete the oldest pages until the cache is back under 90% of max_bytes"""
+        target = int(self.max_bytes * 0.9)
+        while total > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM ocr_pages ORDER BY last_access LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+            freed = removed = 0
+            for key, size in rows:
+                self._conn.execute("DELETE FROM ocr_pages WHERE key = ?", (key,))
+                freed += size
+                removed += 1
+                total -= size
+                if total <= target:
+                    break
+            self._add_to_total(-freed)
+            self._add_removed(removed)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
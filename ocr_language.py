@@ -0,0 +1,89 @@
+"""Choix de la langue OCR page par page.
+
+Une sonde rapide (bande centrale de la page, réduite à ~100 dpi, moteur LSTM) lit quelques lignes
+avec toutes les langues candidates ; la part de mots outils de chaque langue dans ce texte désigne
+le plus petit jeu de langues à utiliser pour l'OCR complet de la page (« fra », « eng », ou « fra+eng »
+pour une page réellement mixte). Avec osd=True, l'OSD de Tesseract repère d'abord les écritures
+non latines.
+"""
+import re
+
+# Mots outils fréquents et peu ambigus de chaque langue
+STOPWORDS = {
+    "fra": set("le la les des du une et est dans pour pas que qui sur par avec au aux ce cette ces sont "
+               "être ont leur nous vous mais ou où".split()),
+    "eng": set("the and of to is in that for with on are this be by from at as it an was were have has "
+               "which not or their will".split()),
+    "deu": set("der die das und ist nicht mit auf für den dem des ein eine zu von sich auch wird werden "
+               "sind im".split()),
+    "spa": set("el los las del y es en que por con para una se su al lo como más pero sus le ya".split()),
+    "ita": set("il gli della delle che è di per con non una sono anche nel alla dei come più questo".split()),
+    "nld": set("de het een van en is dat op te zijn met voor niet aan er ook als bij door".split()),
+    "por": set("o os as da do das dos e é em que não uma com para por se na no mais".split()),
+}
+# Écriture détectée par l'OSD -> langue Tesseract
+SCRIPT_LANGUAGES = {
+    "Cyrillic": "rus",
+    "Arabic": "ara",
+    "Greek": "ell",
+    "Hebrew": "heb",
+    "Han": "chi_sim",
+    "Japanese": "jpn",
+    "Hangul": "kor",
+}
+PROBE_WIDTH = 850  # ~100 dpi sur une page A4
+MIN_STOPWORD_RATIO = 0.08
+MIXED_RATIO = 0.5
+
+_WORD = re.compile(r"[^\W\d_]+")
+
+
+def stopword_ratios(text, candidates):
+    """Share of the words of text that are stopwords of each candidate language"""
+    words = [word.lower() for word in _WORD.findall(text)]
+    if not words:
+        return {}
+    return {language: sum(word in STOPWORDS[language] for word in words) / len(words)
+            for language in candidates if language in STOPWORDS}
+
+
+def choose_languages(ratios, candidates):
+    """Smallest language set explaining the probe text; all candidates when it is inconclusive"""
+    ranked = sorted(ratios.items(), key=lambda item: item[1], reverse=True)
+    if not ranked or ranked[0][1] < MIN_STOPWORD_RATIO:
+        return "+".join(candidates)
+    best, best_ratio = ranked[0]
+    # Page mixte : la deuxième langue pèse au moins la moitié de la première
+    if len(ranked) > 1 and ranked[1][1] >= max(MIN_STOPWORD_RATIO, best_ratio * MIXED_RATIO):
+        return f"{best}+{ranked[1][0]}"
+    return best
+
+
+def probe_image(image):
+    """Central band of the page, downscaled: enough lines to recognize the language, a fraction of the cost"""
+    image = image.convert("L")
+    band = image.crop((0, int(image.height * 0.15), image.width, int(image.height * 0.55)))
+    if band.width > PROBE_WIDTH:
+        band = band.resize((PROBE_WIDTH, max(1, int(band.height * PROBE_WIDTH / band.width))))
+    return band
+
+
+def detect_language(page, candidates, osd=False):
+    """Tesseract language string for a page (PIL image or image path) among the candidate languages"""
+    import pytesseract  # import différé
+    from PIL import Image
+    candidates = list(candidates)
+    if len(candidates) == 1:
+        return candidates[0]
+    image = Image.open(page) if isinstance(page, str) else page
+    if osd:
+        try:
+            script = pytesseract.image_to_osd(image, output_type=pytesseract.Output.DICT).get("script")
+            if SCRIPT_LANGUAGES.get(script) in candidates:
+                return SCRIPT_LANGUAGES[script]
+        except Exception:
+            pass  # OSD indisponible (osd.traineddata absent) ou page sans texte : on passe à la sonde
+    latin_candidates = [language for language in candidates if language in STOPWORDS] or candidates
+    text = pytesseract.image_to_string(probe_image(image), lang="+".join(latin_candidates),
+                                       config="--oem 1 --psm 6")
+    return choose_languages(stopword_ratios(text, latin_candidates), latin_candidates)
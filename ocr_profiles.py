@@ -0,0 +1,79 @@
+"""Profils OCR nommés : résolution de rendu, niveaux de gris / binarisation, réduction des pages
+trop grandes et réglages Tesseract (--oem / --psm). Une page dont la confiance Tesseract est trop
+basse est relancée avec le profil suivant, plus précis."""
+
+OCR_PROFILES = {
+    "fast": {
+        "dpi": 150,
+        "grayscale": True,
+        "threshold": True,  # binarisation (Otsu) avant Tesseract
+        "max_pixels": 6_000_000,  # au-delà, la page est réduite avant l'OCR
+        "oem": 1,  # moteur LSTM seul
+        "psm": 6,
+    },
+    "balanced": {
+        "dpi": 200,
+        "grayscale": True,
+        "threshold": False,
+        "max_pixels": 12_000_000,
+        "oem": 3,
+        "psm": 6,
+    },
+    "accurate": {
+        "dpi": 300,
+        "grayscale": False,
+        "threshold": False,
+        "max_pixels": None,
+        "oem": 3,
+        "psm": 3,  # segmentation automatique, pour les mises en page complexes
+    },
+}
+
+# Ordre de repli quand la confiance est trop basse
+PROFILE_ORDER = ["fast", "balanced", "accurate"]
+
+
+def next_profile(name):
+    """Higher-quality profile to retry with, or None for the most accurate one"""
+    index = PROFILE_ORDER.index(name)
+    return PROFILE_ORDER[index + 1] if index + 1 < len(PROFILE_ORDER) else None
+
+
+def tesseract_config(profile):
+    return f"--oem {profile['oem']} --psm {profile['psm']} -c preserve_interword_spaces=1"
+
+
+def otsu_threshold(image):
+    """Threshold maximizing the between-class variance of a grayscale image histogram"""
+    histogram = image.histogram()[:256]
+    total = sum(histogram)
+    weighted_total = sum(i * count for i, count in enumerate(histogram))
+    background = weighted_background = 0
+    best_threshold, best_variance = 127, 0.0
+    for i, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        weighted_background += i * count
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = i, variance
+    return best_threshold
+
+
+def preprocess(image, profile):
+    """Apply the profile's image preparation to a rendered page (PIL image)"""
+    if profile["max_pixels"] and image.width * image.height > profile["max_pixels"]:
+        scale = (profile["max_pixels"] / (image.width * image.height)) ** 0.5
+        image = image.resize((int(image.width * scale), int(image.height * scale)))
+    if profile["grayscale"] or profile["threshold"]:
+        image = image.convert("L")
+    if profile["threshold"]:
+        threshold = otsu_threshold(image)
+        image = image.point(lambda value: 255 if value > threshold else 0)
+    return image
@@ -1,152 +1,467 @@
-import pytesseract
-from pdf2image import convert_from_path
-import os
-
-from pdf2image.exceptions import PDFInfoNotInstalledError
+import hashlib
+import logging
 import os
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 os.environ['PATH'] += os.pathsep + r'C:\Program Files\poppler\poppler-24.08.0\Library\bin'
 
-from keybert import KeyBERT
-from mistralai import Mistral
+from base_analyzer import BaseAnalyzer
+from content_hash import file_sha256, text_sha256
+from ocr_cache import OCRCache
+from ocr_profiles import OCR_PROFILES, next_profile, preprocess, tesseract_config
+from ocr_language import detect_language
+from page_filter import DUPLICATE_DISTANCE, DuplicateFinder, page_features
+import metrics
+
+# Messages de progression : les durées de chaque étape sont dans les spans de metrics
+logger = logging.getLogger(__name__)
+
+class PDFAnalyzer(BaseAnalyzer):
+    # Taille du texte envoyé tel quel dans les prompts (au-delà : tronqué, ou map-reduce)
+    PROMPT_CHARS = 5000
+    DOCUMENT_KIND = "un document PDF"
+    SUMMARY_INSTRUCTIONS = """un résumé concis et détaillé (5-10 phrases) qui :
+                    1. Capture tous les points essentiels du document de manière approfondie
+                    2. Intègre naturellement les mots-clés identifiés
+                    3. Est structuré de manière cohérente avec des transitions logiques
+                    4. Conserve la complexité et les nuances du contenu d'origine"""
 
-class PDFAnalyzer:
-    def __init__(self):
-            print("Initializing PDF Analyzer...")
-            # Initialisation de KeyBERT
-            self.keyword_model = KeyBERT(model="all-MiniLM-L6-v2")
-            # Initialisation de Mistral
-            self.mistral_client = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
+    def __init__(self, ocr_workers=None, render_batch_size=8, ocr_cache=None, ocr_profile=None, llm_mode=None,
+                 summary_mode=None, min_confidence=60, ocr_languages=None):
+            logger.debug("Initializing PDF Analyzer...")
+            super().__init__(llm_mode, summary_mode)
+            # Cache disque du texte OCR (False pour le désactiver)
+            self.ocr_cache = OCRCache() if ocr_cache is None else (ocr_cache or None)
+            # Profil OCR (fast / balanced / accurate, voir ocr_profiles) ; une page sous min_confidence
+            # est relancée avec le profil suivant
+            self.ocr_profile = ocr_profile or os.getenv("OCR_PROFILE", "balanced")
+            if self.ocr_profile not in OCR_PROFILES:
+                raise ValueError(f"Profil OCR inconnu : {self.ocr_profile}")
+            self.min_confidence = min_confidence
+            # Langues candidates de la sélection automatique (language="auto") : chaque page est OCRisée
+            # avec le plus petit jeu de langues détecté par une sonde basse résolution (voir ocr_language)
+            self.ocr_languages = (ocr_languages or os.getenv("OCR_LANGUAGES", "fra+eng")).split("+")
+            self.language_osd = os.getenv("OCR_LANGUAGE_OSD", "0") == "1"
+            # Résolution des miniatures servant d'empreinte aux pages image (ré-analyse incrémentale, tri)
+            self.fingerprint_dpi = 30
+            # Tri avant OCR (voir page_filter) : pages blanches ignorées, quasi-doublons d'une page déjà
+            # OCRisée (même document, ou tout le corpus via le cache OCR) repris sans OCR ; PAGE_FILTER=0 le coupe
+            self.page_filter = os.getenv("PAGE_FILTER", "1") != "0"
+            self.duplicate_distance = int(os.getenv("PAGE_DUPLICATE_DISTANCE", DUPLICATE_DISTANCE))
+            # Nombre de pages OCRisées en parallèle (un process Tesseract par page)
+            self.ocr_workers = ocr_workers or os.cpu_count() or 1
+            # Nombre de pages rendues à la fois : borne la mémoire et le disque utilisés
+            self.render_batch_size = render_batch_size
             # Définir explicitement le chemin vers Tesseract
             # pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
             # Définir explicitement le chemin vers les données
             os.environ['TESSDATA_PREFIX'] = r'C:\Program Files\Tesseract-OCR\tessdata'
 
-    def extract_text(self, pdf_path, language="fra"):
-        """Extract text from PDF file using OCR"""
+    def extract_text(self, pdf_path, language="auto"):
+        """Extract text from PDF file, using OCR only where there is no usable text layer"""
+        pages = self.extract_pages(pdf_path, language)
+        return "\n\n".join(page["text"] for page in pages if page["text"])
+
+    def extract_pages(self, pdf_path, language="auto", previous_units=None):
+        """Extract text page by page; each page reports the path it took ("text_layer", "ocr", "reused",
+        "blank" or "duplicate", with "duplicate_of" for a repeat of an earlier page of the document).
+
+        language="auto" picks the OCR language(s) of each page among ocr_languages; OCR pages report it.
+
+        previous_units ({page hash: text}) turns on incremental mode: image-only pages get a cheap
+        fingerprint, and those already seen in the previous version reuse their text instead of OCR.
+        """
         try:
             # Obtenir et afficher le chemin absolu (comme dans PPTAnalyzer)
             abs_path = os.path.abspath(pdf_path)
-            print(f"\nLe document analysé est situé ici : {abs_path}")
-
-            # Convertir le PDF en images
-            print("Converting PDF to images...")
-            pages = convert_from_path(pdf_path)
-
-            # Extraire le texte de chaque page
-            text_content = []
-            for i, page in enumerate(pages, start=1):
-                print(f"Processing page {i}/{len(pages)}...")
-                text = self.process_page(page, language)
-                if text:
-                    text_content.append(text)
-                else:
-                    print(f"Warning: No text extracted from page {i}")
+            logger.info(f"Le document analysé est situé ici : {abs_path}")
+
+            # Import différé : pdf2image n'est chargé que si un PDF est analysé
+            from pdf2image import pdfinfo_from_path
+
+            page_count = pdfinfo_from_path(pdf_path)["Pages"]
+
+            # Les PDF natifs ont déjà leur texte : on ne passe en OCR que les pages sans texte exploitable
+            page_texts = {}
+            sources = {}
+            hashes = {}
+            page_details = {}
+            with metrics.span("text_layer", pages=page_count, bytes=os.path.getsize(pdf_path)) as attrs:
+                text_layer = self.extract_text_layer(pdf_path, page_count)
+                attrs["chars"] = sum(len(text) for text in text_layer)
+            for i, text in enumerate(text_layer, start=1):
+                if self.is_usable_text(text):
+                    page_texts[i] = self.clean_text(text)
+                    sources[i] = "text_layer"
+                    hashes[i] = text_sha256("text_layer", page_texts[i])
+            ocr_pages = [i for i in range(1, page_count + 1) if i not in sources]
+
+            features = {}
+            if ocr_pages and (previous_units is not None or self.page_filter):
+                # Une seule passe de miniatures sert à l'empreinte et au tri avant OCR
+                with metrics.span("fingerprint", pages=len(ocr_pages)):
+                    hashes.update(self.fingerprint_pages(pdf_path, ocr_pages,
+                                                         features if self.page_filter else None))
+            if previous_units is not None:
+                # Ré-analyse incrémentale : les pages image inchangées reprennent leur texte précédent
+                for i in ocr_pages:
+                    if hashes[i] in previous_units:
+                        page_texts[i] = previous_units[hashes[i]]
+                        sources[i] = "reused"
+                ocr_pages = [i for i in ocr_pages if i not in sources]
 
-            # Combiner le texte de toutes les pages
-            full_text = "\n\n".join(text_content)
-            
-            if not full_text.strip():
-                print("No text found in PDF")
-                return ""
+            duplicates = {}
+            if self.page_filter and ocr_pages:
+                with metrics.span("page_filter", pages=len(ocr_pages)) as attrs:
+                    blank_pages, duplicates = self.filter_pages(ocr_pages, features)
+                    attrs.update(blank=len(blank_pages), duplicates=len(duplicates))
+                for i in blank_pages:
+                    page_texts[i] = ""
+                    sources[i] = "blank"
+                ocr_pages = [i for i in ocr_pages if i not in sources and i not in duplicates]
+            logger.info(f"{page_count} pages: {sum(source == 'text_layer' for source in sources.values())} with a text layer, "
+                  f"{sum(source == 'reused' for source in sources.values())} unchanged, "
+                  f"{sum(source == 'blank' for source in sources.values())} blank, {len(duplicates)} repeated, "
+                  f"{len(ocr_pages)} to OCR")
 
-            print("\nExtraction completed successfully")
-            return full_text
+            if ocr_pages:
+                with metrics.span("ocr", pages=len(ocr_pages), profile=self.ocr_profile):
+                    page_hashes = {i: features[i]["dhash"] for i in ocr_pages if i in features}
+                    page_texts.update(self.ocr_pages(pdf_path, ocr_pages, language, page_details, page_hashes))
+                for i in ocr_pages:
+                    sources[i] = "ocr"
+            # Les doublons reprennent le texte (et la langue) de leur première occurrence
+            for i, original in duplicates.items():
+                page_texts[i] = page_texts.get(original, "")
+                sources[i] = "duplicate"
+                page_details[i] = dict(page_details.get(original, {}), duplicate_of=original)
+
+            # Remettre les pages dans l'ordre du document
+            pages = []
+            for i in range(1, page_count + 1):
+                text = page_texts.get(i, "")
+                if not text and sources[i] != "blank":
+                    logger.warning(f"Warning: No text extracted from page {i}")
+                pages.append({"page": i, "text": text, "source": sources[i], "hash": hashes.get(i)})
+                # Langue OCR, et source « duplicate » des pages reprises d'un autre document du corpus
+                pages[-1].update(page_details.get(i, {}))
+
+            if not any(page["text"].strip() for page in pages):
+                logger.warning("No text found in PDF")
+            else:
+                logger.debug("Extraction completed successfully")
+            return pages
 
         except Exception as e:
-            print(f"Error extracting text: {str(e)}")
+            logger.error(f"Error extracting text: {str(e)}")
             raise
 
-    def process_page(self, page, language):
-        """Helper function to process page with error handling"""
-        custom_config = r'--oem 3 --psm 6 -c preserve_interword_spaces=1'
+    def fingerprint_pages(self, pdf_path, page_numbers, features=None):
+        """Content hash of image-only pages, from a small grayscale render (much cheaper than OCR).
+
+        features, when given, receives the pre-OCR features of each page (see page_filter).
+        """
+        from pdf2image import convert_from_path
+        hashes = {}
+        for first_page, last_page in self._page_ranges(page_numbers):
+            images = convert_from_path(pdf_path, dpi=self.fingerprint_dpi, first_page=first_page,
+                                       last_page=last_page, grayscale=True)
+            for offset, image in enumerate(images):
+                hashes[first_page + offset] = hashlib.sha256(image.tobytes()).hexdigest()
+                if features is not None:
+                    features[first_page + offset] = page_features(image)
+        return hashes
+
+    def extract_text_layer(self, pdf_path, page_count):
+        """Read the embedded text of every page with poppler's pdftotext (one string per page)"""
         try:
-            # On demande explicitement à Tesseract de nous donner le texte en UTF-8
-            raw_text = pytesseract.image_to_string(
-                page,
-                lang=language,
-                config=custom_config,
-                output_type=pytesseract.Output.STRING
+            result = subprocess.run(
+                ["pdftotext", "-enc", "UTF-8", pdf_path, "-"],
+                capture_output=True,
+                check=True,
             )
-            
-            if not raw_text:
-                return ""
-            
-            # Au lieu de manipuler l'encodage, on nettoie simplement les caractères non désirés
-            # tout en préservant les caractères accentués
-            cleaned_text = ''
-            for char in raw_text:
-                # On garde tous les caractères alphanumériques et la ponctuation de base
-                if (char.isalnum() or 
-                    char.isspace() or 
-                    char in '.,!?-:;\'\"()[]{}' or
-                    ord(char) > 127):  # Ceci préserve les caractères accentués
-                    cleaned_text += char
-            
-            return cleaned_text.strip()
-                
-        except Exception as e:
-            print(f"Error processing page (detail): {repr(e)}")  # Utilisation de repr() pour plus de détails
-            return ""
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning(f"Text layer unavailable, falling back to OCR: {str(e)}")
+            return [""] * page_count
+        # pdftotext sépare les pages par un saut de page (form feed)
+        texts = result.stdout.decode("utf-8", errors="replace").split("\f")
+        return (texts + [""] * page_count)[:page_count]
+
+    def is_usable_text(self, text, min_chars=40):
+        """Tell whether a text layer is real text rather than empty or garbled content"""
+        stripped = "".join(text.split())
+        if len(stripped) < min_chars:
+            return False
+        # Polices mal encodées : caractères de remplacement ou de contrôle, peu de lettres
+        letters = sum(char.isalpha() for char in stripped)
+        garbage = sum(char == "\ufffd" or (not char.isprintable()) for char in stripped)
+        if letters / len(stripped) < 0.5 or garbage / len(stripped) > 0.05:
+            return False
+        # Texte « éclaté » (une lettre par mot) ou sans espaces : extraction inutilisable
+        words = text.split()
+        average_word_length = len(stripped) / len(words)
+        return 2 <= average_word_length <= 20
+
+    def filter_pages(self, page_numbers, features):
+        """Pages that need no OCR: (blank pages, {repeated page: its first occurrence in the document})"""
+        blank_pages = []
+        duplicates = {}
+        finder = DuplicateFinder(self.duplicate_distance)
+        for page_number in page_numbers:
+            page = features[page_number]
+            if page["blank"]:
+                blank_pages.append(page_number)
+                continue
+            original = finder.find(page["dhash"])
+            if original is None:
+                finder.add(page_number, page["dhash"])
+            else:
+                duplicates[page_number] = original
+        return blank_pages, duplicates
+
+    def ocr_pages(self, pdf_path, page_numbers, language, page_details=None, page_hashes=None):
+        """OCR the given pages with a pool of workers; returns {page number: text}.
+
+        page_details, when given, receives the language used for each page. page_hashes ({page number:
+        perceptual hash}) lets cache misses reuse the text of a near-identical page of another document.
+        """
+        page_details = {} if page_details is None else page_details
+        page_hashes = page_hashes or {}
+        logger.info(f"Converting and processing {len(page_numbers)} pages "
+              f"({self.ocr_workers} OCR workers)...")
+
+        if self.ocr_workers > 1:
+            # Tesseract est déjà parallélisé par page : on évite la sur-souscription OpenMP
+            os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+        profile = OCR_PROFILES[self.ocr_profile]
+        page_texts = {}
+        cache_keys = {}
+        cache_setup = None
+        duplicate_hits = 0
+        if self.ocr_cache is not None:
+            content_hash = file_sha256(pdf_path)
+            # En sélection automatique, la clé porte les langues candidates ; la langue retenue
+            # pour la page est gardée avec le texte
+            cache_language = language if language != "auto" else "auto:" + "+".join(self.ocr_languages)
+            cache_config = f"{self.ocr_profile}:{self.min_confidence}:{tesseract_config(profile)}"
+            cache_setup = OCRCache.make_setup(cache_language, cache_config, profile["dpi"])
+            for page_number in page_numbers:
+                key = OCRCache.make_key(content_hash, page_number, cache_language, cache_config, profile["dpi"])
+                cached = self.ocr_cache.get_entry(key)
+                if cached is None and page_number in page_hashes:
+                    # Page déjà OCRisée dans un autre document (page de garde, mentions légales...),
+                    # avec les mêmes langues, configuration Tesseract et dpi
+                    cached = self.ocr_cache.find_similar(page_hashes[page_number], self.duplicate_distance,
+                                                         cache_setup)
+                    if cached is not None:
+                        duplicate_hits += 1
+                        page_details[page_number] = {"source": "duplicate"}
+                if cached is None:
+                    cache_keys[page_number] = key
+                else:
+                    page_texts[page_number], language_used = cached
+                    if language_used:
+                        page_details.setdefault(page_number, {})["language"] = language_used
+            page_numbers = list(cache_keys)
+            logger.info(f"OCR cache: {len(page_texts) - duplicate_hits} hits, {duplicate_hits} near-duplicates, "
+                  f"{len(page_numbers)} pages to OCR")
+            metrics.annotate(cache_hits=len(page_texts) - duplicate_hits, duplicate_hits=duplicate_hits,
+                             cache_misses=len(page_numbers))
+            if not page_numbers:
+                return page_texts
+
+        with tempfile.TemporaryDirectory() as output_folder, \
+                ThreadPoolExecutor(max_workers=self.ocr_workers) as pool:
+            pending = {}
+            for first_page, image_paths in self.iter_page_batches(pdf_path, page_numbers, output_folder):
+                for offset, image_path in enumerate(image_paths):
+                    future = metrics.submit_in_context(pool, self.ocr_page, pdf_path, first_page + offset,
+                                                       image_path, language, output_folder)
+                    pending[future] = (first_page + offset, image_path)
+                # Contre-pression : on ne rend pas le lot suivant tant qu'un lot entier attend
+                while len(pending) > self.render_batch_size:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    self._collect_pages(done, pending, page_texts, cache_keys, page_details, page_hashes,
+                                        cache_setup)
+            self._collect_pages(list(pending), pending, page_texts, cache_keys, page_details, page_hashes,
+                                cache_setup)
+        return page_texts
+
+    def iter_page_batches(self, pdf_path, page_numbers, output_folder):
+        """Render runs of consecutive pages in bounded batches, yielding (first_page, image paths)"""
+        from pdf2image import convert_from_path
+        for first_page, last_page in self._page_ranges(page_numbers):
+            # Les pages sont écrites sur disque : aucune image PIL n'est gardée en mémoire
+            with metrics.span("render", pages=last_page - first_page + 1,
+                              dpi=OCR_PROFILES[self.ocr_profile]["dpi"]) as attrs:
+                image_paths = convert_from_path(
+                    pdf_path,
+                    first_page=first_page,
+                    last_page=last_page,
+                    output_folder=output_folder,
+                    dpi=OCR_PROFILES[self.ocr_profile]["dpi"],
+                    grayscale=OCR_PROFILES[self.ocr_profile]["grayscale"],
+                    fmt="png",
+                    paths_only=True,
+                    thread_count=min(self.ocr_workers, last_page - first_page + 1),
+                )
+                attrs["bytes"] = sum(os.path.getsize(path) for path in image_paths)
+            yield first_page, image_paths
+
+    def _page_ranges(self, page_numbers):
+        """Group sorted page numbers into consecutive ranges of at most render_batch_size pages"""
+        ranges = []
+        for page_number in sorted(page_numbers):
+            if (ranges and page_number == ranges[-1][1] + 1
+                    and page_number - ranges[-1][0] < self.render_batch_size):
+                ranges[-1][1] = page_number
+            else:
+                ranges.append([page_number, page_number])
+        return [tuple(page_range) for page_range in ranges]
+
+    def _collect_pages(self, done, pending, page_texts, cache_keys, page_details, page_hashes, cache_setup=None):
+        """Store the OCR result of finished pages and delete their rendered image"""
+        for future in done:
+            page_number, image_path = pending.pop(future)
+            page_texts[page_number], language_used = future.result()
+            page_details[page_number] = {"language": language_used}
+            os.remove(image_path)
+            # Un texte vide peut venir d'une erreur Tesseract : on ne le met pas en cache
+            if page_texts[page_number] and page_number in cache_keys:
+                self.ocr_cache.put(cache_keys[page_number], page_texts[page_number], language_used,
+                                   page_hashes.get(page_number), cache_setup)
+            logger.debug(f"Processed page {page_number} (OCR)")
+
+    def ocr_page(self, pdf_path, page_number, image_path, language, output_folder):
+        """OCR one rendered page, retrying with higher-quality profiles while Tesseract confidence stays low.
+
+        Returns (text, language used).
+        """
+        profile_name = self.ocr_profile
+        retry_path = None
+        with metrics.span("ocr_page", page=page_number, retries=0) as attrs:
+            if language == "auto":
+                language = self.detect_page_language(image_path)
+            attrs["language"] = language
+            try:
+                while True:
+                    text, confidence = self.ocr_image(image_path, language, OCR_PROFILES[profile_name])
+                    retry_profile = next_profile(profile_name)
+                    # Pas de mots reconnus (page blanche) : relancer ne servirait à rien
+                    if confidence is None or confidence >= self.min_confidence or retry_profile is None:
+                        attrs.update(profile=profile_name, confidence=confidence, chars=len(text))
+                        return text, language
+                    logger.info(f"Page {page_number}: confidence {confidence:.0f} with '{profile_name}', "
+                          f"retrying with '{retry_profile}'")
+                    attrs["retries"] += 1
+                    profile_name = retry_profile
+                    if retry_path:
+                        os.remove(retry_path)
+                    retry_path = image_path = self.render_page(pdf_path, page_number,
+                                                               OCR_PROFILES[profile_name], output_folder)
+            finally:
+                if retry_path:
+                    os.remove(retry_path)
+
+    def render_page(self, pdf_path, page_number, profile, output_folder):
+        """Render a single page with the given profile and return the image path"""
+        from pdf2image import convert_from_path
+        return convert_from_path(
+            pdf_path,
+            first_page=page_number,
+            last_page=page_number,
+            output_folder=output_folder,
+            dpi=profile["dpi"],
+            grayscale=profile["grayscale"],
+            fmt="png",
+            paths_only=True,
+        )[0]
 
-    def extract_keywords(self, text):
-        """Extract keywords from text using KeyBERT"""
-        print("\nExtracting keywords...")
+    def detect_page_language(self, page):
+        """Smallest set of ocr_languages for a page (low-resolution probe); all of them if detection fails"""
+        with metrics.span("language_probe") as attrs:
+            try:
+                attrs["language"] = detect_language(page, self.ocr_languages, osd=self.language_osd)
+            except Exception as e:
+                logger.warning(f"Language detection failed, using {'+'.join(self.ocr_languages)}: {repr(e)}")
+                attrs["language"] = "+".join(self.ocr_languages)
+            return attrs["language"]
+
+    def process_page(self, page, language):
+        """Helper function to process page (PIL image or image path) with error handling"""
+        if language == "auto":
+            language = self.detect_page_language(page)
+        return self.ocr_image(page, language, OCR_PROFILES[self.ocr_profile])[0]
+
+    def ocr_image(self, page, language, profile):
+        """OCR a page image with a profile; returns (cleaned text, mean word confidence or None)"""
+        import pytesseract  # import différé, coûteux au démarrage
+        from PIL import Image
         try:
-            keywords = self.keyword_model.extract_keywords(
-                text,
-                keyphrase_ngram_range=(1, 1),  # Extrait les mots simples et les paires
-                top_n=10,
-                use_maxsum=True,
-                nr_candidates=20
+            image = Image.open(page) if isinstance(page, str) else page
+            image = preprocess(image, profile)
+            # image_to_data donne le texte et la confiance de chaque mot en un seul passage
+            data = pytesseract.image_to_data(
+                image,
+                lang=language,
+                config=tesseract_config(profile),
+                output_type=pytesseract.Output.DICT
             )
-            
-            print("\nKeywords found:")
-            for keyword, score in keywords:
-                print(f"- {keyword}: {score:.3f}")
-            
-            return [kw for kw, _ in keywords]
-            
         except Exception as e:
-            print(f"Error extracting keywords: {str(e)}")
-            return []
+            logger.error(f"Error processing page (detail): {repr(e)}")  # Utilisation de repr() pour plus de détails
+            return "", None
 
-    def generate_summary(self, text, keywords):
-        print("\nGenerating summary...")
-        try:
-            messages = [
-                {
-                    "role": "user",
-                    "content": f"""Voici un texte extrait d'un document PDF.
-                    Les mots-clés importants sont : {', '.join(keywords)}
-                    
-                    Texte : {text[:5000]}
-                    
-                    Tu dois générer un résumé concis et détaillé (5-10 phrases) qui :
-                    1. Capture tous les points essentiels du document de manière approfondie 
-                    2. Intègre naturellement les mots-clés identifiés
-                    3. Est structuré de manière cohérente avec des transitions logiques
-                    4. Conserve la complexité et les nuances du contenu d'origine"""
-                }
-            ]
+        lines = {}
+        confidences = []
+        for i, word in enumerate(data["text"]):
+            if not word.strip():
+                continue
+            lines.setdefault((data["block_num"][i], data["par_num"][i], data["line_num"][i]), []).append(word)
+            confidence = float(data["conf"][i])
+            if confidence >= 0:
+                confidences.append(confidence)
 
-            response = self.mistral_client.chat.complete(
-                model="mistral-tiny",
-                messages=messages,
-            )
-            
-            summary = response.choices[0].message.content
-            print(f"\nGenerated summary: {summary}")
-            return summary
-            
-        except Exception as e:
-            print(f"Error generating summary: {str(e)}")
-            return ""
+        raw_text = "\n".join(" ".join(words) for words in lines.values())
+        mean_confidence = sum(confidences) / len(confidences) if confidences else None
+        return self.clean_text(raw_text), mean_confidence
 
+    def clean_text(self, raw_text):
+        """Remove unwanted characters while keeping accented ones"""
+        # Au lieu de manipuler l'encodage, on nettoie simplement les caractères non désirés
+        # tout en préservant les caractères accentués
+        cleaned_text = ''
+        for char in raw_text:
+            # On garde tous les caractères alphanumériques et la ponctuation de base
+            if (char.isalnum() or 
+                char.isspace() or 
+                char in '.,!?-:;\'\"()[]{}' or
+                ord(char) > 127):  # Ceci préserve les caractères accentués
+                cleaned_text += char
+        
+        return cleaned_text.strip()
 
-    def extract_table_of_contents(self, text):
-        print("\nExtracting/generating table of contents...")
-        try:
-            messages = [
+    def extract_title(self, text):
+        """Use the first non-empty line of the document as its title"""
+        for line in text.splitlines():
+            if line.strip():
+                return line.strip()[:200]
+        return "Sans titre"
+
+    # Paramètres KeyBERT de ce format, partagés par extract_keywords et le mode par lots
+    KEYWORD_PARAMS = {
+        "keyphrase_ngram_range": (1, 1),  # Extrait les mots simples
+        "top_n": 10,
+        "use_maxsum": True,
+        "nr_candidates": 20,
+    }
+
+    def toc_request(self, text, toc_hints=None):
+        """Chat completion parameters of the table of contents prompt"""
+        return {
+            "model": "mistral-tiny",  # Utilisation du modèle tiny pour le POC
+            "messages": [
                 {
                     "role": "user",
                     "content": f"""Analyse ce texte extrait d'un document PDF et fais l'une des trois choses suivantes :
@@ -155,81 +470,101 @@ class PDFAnalyzer:
                     2. Si tu ne trouves pas de sommaire explicite mais que le texte a une structure claire avec des sections distinctes, génère un sommaire qui reflète cette structure.
                     3. Si le texte n'a pas de structure claire ou de sections distinctes, retourne une chaîne vide.
 
-                    Texte : {text[:5000]}
+                    Texte : {text[:self.PROMPT_CHARS]}
 
                     Important : Ne génère pas de sommaire artificiel si le texte n'a pas de structure claire."""
                 }
-            ]
+            ],
+        }
 
-            response = self.mistral_client.chat.complete(
-                model="mistral-tiny",  # Utilisation du modèle tiny pour le POC
-                messages=messages,
-            )
-            
-            toc = response.choices[0].message.content
-            print(f"\nTable of contents result: {toc}")
-            return toc if toc and not toc.lower().startswith("le texte ne") else ""
-            
-        except Exception as e:
-            print(f"Error extracting table of contents: {str(e)}")
-            return ""
-
-            response = self.mistral_client.chat.complete(
-                model="mistral-tiny",
-                messages=messages,
-                max_tokens=1000,  # Augmente la longueur maximale de la réponse
-                temperature=0.7,  # Légère augmentation de la créativité
-            )
-            
-            summary = response.choices[0].message.content
-            print(f"\nGenerated summary: {summary}")
-            return summary
-            
-        except Exception as e:
-            print(f"Error generating summary: {str(e)}")
-            return ""
+    def combined_request(self, text, keywords, toc_hints=None):
+        """Single prompt returning the summary and the table of contents as one JSON object"""
+        return {
+            "model": "mistral-tiny",
+            "response_format": {"type": "json_object"},
+            "messages": [
+                {
+                    "role": "user",
+                    "content": f"""Voici un texte extrait d'un document PDF.
+                    Les mots-clés importants sont : {', '.join(keywords)}
+
+                    Texte : {text[:self.PROMPT_CHARS]}
+
+                    Réponds uniquement avec un objet JSON de la forme
+                    {{"summary": "...", "table_of_contents": "..."}} où :
+                    - "summary" est un résumé concis et détaillé (5-10 phrases) fidèle au contenu d'origine
+                      et intégrant naturellement les mots-clés identifiés ;
+                    - "table_of_contents" est le sommaire du document s'il en contient un, ou un sommaire
+                      reflétant sa structure si elle est claire, sinon une chaîne vide.
+                    Ne génère pas de sommaire artificiel sans structure claire."""
+                }
+            ],
+        }
+
+    def extract_content(self, pdf_path, with_keywords=True, previous_units=None):
+        """Everything but the LLM fields: title, text, keywords, page sources and per-page units"""
+        # Obtenir et afficher le chemin absolu
+        abs_path = os.path.abspath(pdf_path)
+        logger.info(f"Le document analysé est situé ici : {abs_path}")
+        
+        pages = self.extract_pages(pdf_path, previous_units=previous_units)
+        text = "\n\n".join(page["text"] for page in pages if page["text"])
+        # Chemin suivi par chaque page : couche texte, OCR, ou texte repris de la version précédente
+        page_sources = [{key: page[key] for key in ("page", "source", "language", "duplicate_of") if key in page}
+                        for page in pages]
+        # Unités de la ré-analyse incrémentale : empreinte et texte de chaque page
+        units = [{"hash": page["hash"], "text": page["text"]} for page in pages]
+
+        if not text.strip():
+            return {"title": "Sans titre", "text": "", "keywords": [], "page_sources": page_sources, "units": units}
+
+        content = {
+            "title": self.extract_title(text),
+            "text": text,
+            "keywords": [],
+            "page_sources": page_sources,
+            "units": units,
+        }
+        if with_keywords:
+            # Extraire les mots-clés (avec l'embedding et la catégorie du document)
+            content.update(self.extract_features_many([text])[0])
+        return content
+
+    def build_result(self, content, llm_fields):
+        """Assemble the analysis result from extract_content and the LLM fields"""
+        result = {
+            "title": content["title"],
+            "text_length": len(content["text"].split()),
+            "keywords": content["keywords"],
+            "summary": llm_fields["summary"],
+            "table_of_contents": llm_fields["table_of_contents"],
+            "page_sources": content["page_sources"],
+            "category": content.get("category"),
+            "category_score": content.get("category_score"),
+            # "extracted_text": text[:200] + "..."  # Preview des 200 premiers caractères
+        }
+        if not content["text"].strip():
+            result["extracted_text"] = ""
+        return result
 
     def analyze(self, pdf_path):
             """Main analysis function"""
             try:
-                # Obtenir et afficher le chemin absolu
-                abs_path = os.path.abspath(pdf_path)
-                print(f"\nLe document analysé est situé ici : {abs_path}")
-                
-                text = self.extract_text(pdf_path)
-            
-                if not text.strip():
-                    return {
-                        "title": "Sans titre",
-                        "text_length": 0,
-                        "keywords": [],
-                        "summary": "",
-                        "table_of_contents": "",
-                        "extracted_text": ""
-                    }
-
-                # Extraire les mots-clés
-                keywords = self.extract_keywords(text)
-                # Générer le résumé
-                summary = self.generate_summary(text, keywords)
-                # Extraire le sommaire
-                table_of_contents = self.extract_table_of_contents(text)
-
-                return {
-                    "title": title,
-                    "text_length": len(text.split()),
-                    "keywords": keywords,
-                    "summary": summary,
-                    "table_of_contents": table_of_contents,
-                    # "extracted_text": text[:200] + "..."  # Preview des 200 premiers caractères
-                }
+                content = self.extract_content(pdf_path)
+                if not content["text"].strip():
+                    return self.build_result(content, {"summary": "", "table_of_contents": ""})
+
+                # Générer le résumé et extraire le sommaire
+                llm_fields = self.generate_llm_fields(content["text"], content["keywords"])
+                return self.build_result(content, llm_fields)
 
             except Exception as e:
-                print(f"Analysis failed: {str(e)}")
+                logger.error(f"Analysis failed: {str(e)}")
                 raise
 
 # Example usage
 if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
     analyzer = PDFAnalyzer()
     result = analyzer.analyze("Trends_IA.pdf")
     print("\nAnalysis results:", result)
\ No newline at end of file
@@ -1,125 +1,82 @@
-from pptx import Presentation
-from keybert import KeyBERT
-from transformers import pipeline
-import torch
 from dotenv import load_dotenv
+import logging
 import os
-from mistralai import Mistral
-import time
+import model_registry
+from base_analyzer import BaseAnalyzer
+import slide_model
+from content_hash import text_sha256
+import metrics
 
 load_dotenv()  # charger les variables d'environnement depuis .env
 
-class PPTAnalyzer:
-    def __init__(self):
-        print("Initializing KeyBERT model...")
-        self.keyword_model = KeyBERT(model="all-MiniLM-L6-v2")
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.mistral_client = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
-        print(f"Using device: {self.device}")
+# Messages de progression : les durées de chaque étape sont dans les spans de metrics
+logger = logging.getLogger(__name__)
 
-    def extract_text(self, ppt_path):
-        """Extract text from PowerPoint file"""
+class PPTAnalyzer(BaseAnalyzer):
+    # Taille du texte envoyé tel quel dans les prompts (au-delà : tronqué, ou map-reduce)
+    PROMPT_CHARS = 2000
+    DOCUMENT_KIND = "une présentation PowerPoint"
+    SUMMARY_INSTRUCTIONS = """un résumé concis (2-7 phrases) qui :
+                    1. Capture les points essentiels du document
+                    2. Intègre naturellement les mots-clés identifiés
+                    3. Est fidèle au contenu d'origine"""
+
+    def __init__(self, llm_mode=None, summary_mode=None, fast_parse=None, fast_parse_min_bytes=50 * 1024 * 1024):
+        super().__init__(llm_mode, summary_mode)
+        # Lecture directe du XML (sans python-pptx) : True, False, ou None = selon la taille du fichier
+        self.fast_parse = fast_parse
+        self.fast_parse_min_bytes = fast_parse_min_bytes
+
+    @property
+    def device(self):
+        return model_registry.get_device()
+
+    def extract_slides(self, ppt_path):
+        """Parse the presentation once into the compact slide model (see slide_model)"""
+        fast = self.fast_parse
+        if fast is None:
+            # python-pptx charge tout le paquet (images comprises) : on passe au XML en flux pour les gros decks
+            fast = os.path.getsize(ppt_path) > self.fast_parse_min_bytes
         try:
-            prs = Presentation(ppt_path)
-            text_content = []
-        
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    if hasattr(shape, "text") and shape.text.strip():
-                        text_content.append(shape.text.strip())
-        
-            return " ".join(text_content)
-            
+            with metrics.span("parse", bytes=os.path.getsize(ppt_path), fast=fast) as attrs:
+                slides = (slide_model.parse_presentation_xml(ppt_path) if fast
+                          else slide_model.parse_presentation(ppt_path))
+                attrs["slides"] = len(slides)
+            return slides
         except Exception as e:
-            print(f"Error extracting text: {str(e)}")
+            logger.error(f"Error extracting slides: {str(e)}")
             raise
 
+    def extract_text(self, ppt_path):
+        """Extract text from PowerPoint file"""
+        return slide_model.full_text(self.extract_slides(ppt_path))
+
     def extract_title(self, ppt_path):
         """Extract title from the first slide of PowerPoint file"""
         try:
-            prs = Presentation(ppt_path)
-            if prs.slides:
-                first_slide = prs.slides[0]
-                for shape in first_slide.shapes:
-                    if hasattr(shape, "text"):
-                        title = shape.text.strip()
-                        if title:
-                            return title
-            return "Sans titre"
+            return slide_model.deck_title(self.extract_slides(ppt_path))
         except Exception as e:
-            print(f"Error extracting title: {str(e)}")
+            logger.error(f"Error extracting title: {str(e)}")
             return "Sans titre"
 
-    def extract_keywords(self, text):
-        """Extract keywords from text using KeyBERT"""
-        print("\nExtracting keywords...")
-        try:
-            keywords = self.keyword_model.extract_keywords(
-                text,
-                keyphrase_ngram_range=(1, 2),  # Extract single words and pairs
-                top_n=10,
-                use_maxsum=True,
-                nr_candidates=20
-            )
-            
-            print("\nKeywords found:")
-            for keyword, score in keywords:
-                print(f"- {keyword}: {score:.3f}")
-            
-            return [kw for kw, _ in keywords]
-            
-        except Exception as e:
-            print(f"Error extracting keywords: {str(e)}")
-            return []
-
-    def generate_summary(self, text, keywords):
-        print("\nGenerating summary...")
-        try:
-            time.sleep(1)  # Pause d'1 seconde avant l'appel API
-            prompt = f"""Voici un texte extrait d'une présentation PowerPoint.
-            Les mots-clés importants sont : {', '.join(keywords)}
-            
-            Texte : {text[:2000]}
-            
-            Tu dois générer un résumé concis (2-7 phrases) qui :
-            1. Capture les points essentiels du document
-            2. Intègre naturellement les mots-clés identifiés
-            3. Est fidèle au contenu d'origine"""
+    # Paramètres KeyBERT de ce format, partagés par extract_keywords et le mode par lots
+    KEYWORD_PARAMS = {
+        "keyphrase_ngram_range": (1, 2),  # Extract single words and pairs
+        "top_n": 10,
+        "use_maxsum": True,
+        "nr_candidates": 20,
+    }
 
-            messages = [
-                {
-                    "role": "user",
-                    "content": f"""Voici un texte extrait d'une présentation PowerPoint.
-                    Les mots-clés importants sont : {', '.join(keywords)}
-                    
-                    Texte : {text[:2000]}
-                    
-                    Tu dois générer un résumé concis (2-7 phrases) qui :
-                    1. Capture les points essentiels du document
-                    2. Intègre naturellement les mots-clés identifiés
-                    3. Est fidèle au contenu d'origine"""
-                }
-            ]
-
-
-            response = self.mistral_client.chat.complete(
-                model="mistral-tiny",  # ou "mistral-large-latest"
-                messages=messages,
-            )
-            
-            summary = response.choices[0].message.content
-            print(f"\nGenerated summary: {summary}")
-            return summary
-            
-        except Exception as e:
-            print(f"Error generating summary: {str(e)}")
+    def format_toc_hints(self, toc_hints):
+        if not toc_hints:
             return ""
-    
-    def extract_table_of_contents(self, text):
-        print("\nExtracting/generating table of contents...")
-        try:
-            time.sleep(1)  # Pause d'1 seconde avant l'appel API
-            messages = [
+        return "Titres des slides : " + " | ".join(toc_hints)
+
+    def toc_request(self, text, toc_hints=None):
+        """Chat completion parameters of the table of contents prompt"""
+        return {
+            "model": "mistral-tiny",
+            "messages": [
                 {
                     "role": "user",
                     "content": f"""Analyse ce texte extrait d'une présentation PowerPoint et:
@@ -127,61 +84,101 @@ class PPTAnalyzer:
                     2. Sinon, si tu identifies une structure claire avec des sections marquées par des titres de slides, génère un sommaire basé sur cette structure.
                     3. Si aucune structure claire n'est identifiable, retourne une chaîne vide.
 
-                    Texte : {text[:2000]}
+                    {self.format_toc_hints(toc_hints)}
+
+                    Texte : {text[:self.PROMPT_CHARS]}
 
                     Important : Ne génère pas de sommaire artificiel sans structure claire."""
                 }
-            ]
+            ],
+        }
+
+    def combined_request(self, text, keywords, toc_hints=None):
+        """Single prompt returning the summary and the table of contents as one JSON object"""
+        return {
+            "model": "mistral-tiny",
+            "response_format": {"type": "json_object"},
+            "messages": [
+                {
+                    "role": "user",
+                    "content": f"""Voici un texte extrait d'une présentation PowerPoint.
+                    Les mots-clés importants sont : {', '.join(keywords)}
+                    {self.format_toc_hints(toc_hints)}
 
-            response = self.mistral_client.chat.complete(
-                model="mistral-tiny",
-                messages=messages,
-            )
-            
-            toc = response.choices[0].message.content
-            return toc if toc and not toc.lower().startswith("le texte ne") else ""
-            
-        except Exception as e:
-            print(f"Error extracting table of contents: {str(e)}")
-            return ""
+                    Texte : {text[:self.PROMPT_CHARS]}
+
+                    Réponds uniquement avec un objet JSON de la forme
+                    {{"summary": "...", "table_of_contents": "..."}} où :
+                    - "summary" est un résumé concis (2-7 phrases) fidèle au contenu d'origine
+                      et intégrant naturellement les mots-clés identifiés ;
+                    - "table_of_contents" est le sommaire du document s'il en contient un, ou un sommaire
+                      reflétant sa structure si elle est claire, sinon une chaîne vide.
+                    Ne génère pas de sommaire artificiel sans structure claire."""
+                }
+            ],
+        }
+
+    def extract_content(self, ppt_path, with_keywords=True, previous_units=None):
+        """Everything but the LLM fields: title, text, keywords, TOC hints and per-slide units, from a single parse"""
+        # Obtenir et afficher le chemin absolu
+        abs_path = os.path.abspath(ppt_path)
+        logger.info(f"Le document analysé est situé ici : {abs_path}")
+
+        # La lecture d'une présentation est peu coûteuse : previous_units ne sert qu'aux PDF
+        slides = self.extract_slides(ppt_path)
+        text = slide_model.full_text(slides)
+        title = slide_model.deck_title(slides)
+        # Unités de la ré-analyse incrémentale : empreinte et texte de chaque slide
+        units = [
+            {"hash": text_sha256(slide_model.slide_text(slide), slide["notes"]), "text": slide_model.slide_text(slide)}
+            for slide in slides
+        ]
+
+        if not text.strip():
+            logger.warning("No text found in presentation")
+            return {"title": "Sans titre", "text": "", "keywords": [], "toc_hints": [], "units": units}
+
+        content = {
+            "title": title,
+            "text": text,
+            "keywords": [],
+            "toc_hints": slide_model.toc_hints(slides),
+            "units": units,
+        }
+        if with_keywords:
+            # Mots-clés, embedding et catégorie du document
+            content.update(self.extract_features_many([text])[0])
+        return content
+
+    def build_result(self, content, llm_fields):
+        """Assemble the analysis result from extract_content and the LLM fields"""
+        return {
+            "title": content["title"],
+            "text_length": len(content["text"].split()),
+            "keywords": content["keywords"],
+            "summary" : llm_fields["summary"],
+            "table_of_contents": llm_fields["table_of_contents"],
+            "category": content.get("category"),
+            "category_score": content.get("category_score"),
+        }
 
     def analyze(self, ppt_path):
         """Main analysis function"""
         try:
-            # Obtenir et afficher le chemin absolu
-            abs_path = os.path.abspath(ppt_path)
-            print(f"\nLe document analysé est situé ici : {abs_path}")
-
-            text = self.extract_text(ppt_path)
-            title = self.extract_title(ppt_path) 
-
-            if not text.strip():
-                print("No text found in presentation")
-                return {
-                    "title": "Sans titre",
-                    "text_length": 0,
-                    "keywords": [],
-                    "summary" : "",
-                    "table_of_contents": "",
-                }
-            
-            keywords = self.extract_keywords(text)
-            summary = self.generate_summary(text, keywords)
-
-            return {
-                "title": title,
-                "text_length": len(text.split()),
-                "keywords": keywords,
-                "summary" : summary,
-                "table_of_contents": self.extract_table_of_contents(text)  
-            }
+            content = self.extract_content(ppt_path)
+            if not content["text"].strip():
+                return self.build_result(content, {"summary": "", "table_of_contents": ""})
+
+            llm_fields = self.generate_llm_fields(content["text"], content["keywords"], content["toc_hints"])
+            return self.build_result(content, llm_fields)
             
         except Exception as e:
-            print(f"Analysis failed: {str(e)}")
+            logger.error(f"Analysis failed: {str(e)}")
             raise
 
 # Example usage
 if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
     analyzer = PPTAnalyzer()
     file = r"C:\Users\Joséphine Balland\SCriptsfaitmaison\POC_FRD_2\Charte IA_VF_-Copie.pptx"
     result = analyzer.analyze(file)
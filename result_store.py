@@ -0,0 +1,131 @@
+"""Base des résultats d'analyse (SQLite en mode WAL), indexée par l'empreinte du contenu du fichier.
+
+On y garde le résultat d'analyse, le texte extrait et le texte de chaque page ou slide, avec un index
+plein texte FTS5 sur les titres, le texte et les mots-clés. Un fichier déjà analysé (même contenu,
+quel que soit son nom) est servi depuis la base sans OCR ni appel LLM.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_STORE_PATH = os.path.join(
+    os.getenv("RESULT_STORE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "poc_frd")),
+    "results.sqlite",
+)
+
+
+class ResultStore:
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Même organisation que l'OCRCache : une connexion protégée par un verrou, WAL entre processus
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                content_hash TEXT NOT NULL UNIQUE,
+                path TEXT NOT NULL,
+                title TEXT,
+                category TEXT,
+                result TEXT NOT NULL,
+                text TEXT NOT NULL,
+                analyzed_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                document_id INTEGER NOT NULL REFERENCES documents (id) ON DELETE CASCADE,
+                page INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (document_id, page)
+            );
+            -- Index plein texte ; rowid = documents.id. remove_diacritics : « resume » trouve « résumé »
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                title, text, keywords, tokenize = 'unicode61 remove_diacritics 2'
+            );
+        """)
+
+    def get(self, content_hash):
+        """Stored analysis result of a file content, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM documents WHERE content_hash = ?",
+                                     (content_hash,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_text(self, content_hash):
+        """(full text, [page texts]) of a stored document, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT id, text FROM documents WHERE content_hash = ?",
+                                     (content_hash,)).fetchone()
+            if row is None:
+                return None
+            pages = self._conn.execute("SELECT text FROM pages WHERE document_id = ? ORDER BY page",
+                                       (row[0],)).fetchall()
+        return row[1], [page[0] for page in pages]
+
+    def put(self, record):
+        self.put_many([record])
+
+    def put_many(self, records):
+        """Insert or replace records ({"content_hash", "path", "result", "text", "pages"}) in one transaction"""
+        if not records:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for record in records:
+                    result = record["result"]
+                    row = self._conn.execute("SELECT id FROM documents WHERE content_hash = ?",
+                                             (record["content_hash"],)).fetchone()
+                    if row is not None:
+                        # Réanalyse du même contenu : on remplace tout, index plein texte compris
+                        self._conn.execute("DELETE FROM documents_fts WHERE rowid = ?", row)
+                        self._conn.execute("DELETE FROM pages WHERE document_id = ?", row)
+                        self._conn.execute("DELETE FROM documents WHERE id = ?", row)
+                    document_id = self._conn.execute(
+                        "INSERT INTO documents (content_hash, path, title, category, result, text, analyzed_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (record["content_hash"], record["path"], result.get("title"), result.get("category"),
+                         json.dumps(result, ensure_ascii=False), record["text"], now),
+                    ).lastrowid
+                    self._conn.executemany(
+                        "INSERT INTO pages (document_id, page, text) VALUES (?, ?, ?)",
+                        [(document_id, page, text) for page, text in enumerate(record["pages"], start=1)],
+                    )
+                    self._conn.execute(
+                        "INSERT INTO documents_fts (rowid, title, text, keywords) VALUES (?, ?, ?, ?)",
+                        (document_id, result.get("title") or "", record["text"],
+                         " ".join(result.get("keywords") or [])),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def search(self, query, limit=20):
+        """Full-text search (FTS5 syntax) over titles, text and keywords, best matches first"""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT documents.content_hash, documents.path, documents.title, documents.category,
+                       snippet(documents_fts, 1, '[', ']', '…', 12), bm25(documents_fts, 5.0, 1.0, 3.0)
+                FROM documents_fts JOIN documents ON documents.id = documents_fts.rowid
+                WHERE documents_fts MATCH ?
+                ORDER BY bm25(documents_fts, 5.0, 1.0, 3.0)
+                LIMIT ?
+                """,
+                (query, limit),
+            ).fetchall()
+        return [
+            {"content_hash": content_hash, "path": path, "title": title, "category": category,
+             "snippet": snippet, "score": round(-score, 3)}
+            for content_hash, path, title, category, snippet, score in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
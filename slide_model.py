@@ -0,0 +1,178 @@
+"""Modèle compact d'une présentation : une seule lecture du fichier, puis titre, texte complet
+et indices de sommaire sont tous dérivés de la liste des slides.
+
+Chaque slide est un dict :
+    {"number": 1, "title": "...", "texts": ["...", ...], "notes": "...", "tables": [[["cellule", ...], ...]]}
+"""
+import posixpath
+import xml.etree.ElementTree as ET
+import zipfile
+
+_P = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+_A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_R = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_NOTES_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/notesSlide"
+_TITLE_TYPES = ("title", "ctrTitle")
+
+
+def parse_presentation(ppt_path):
+    """Build the slide list with python-pptx, opening the file once"""
+    from pptx import Presentation  # import différé
+    from pptx.enum.shapes import MSO_SHAPE_TYPE, PP_PLACEHOLDER
+
+    def iter_shapes(shapes):
+        # Les formes groupées contiennent elles-mêmes des formes
+        for shape in shapes:
+            if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+                yield from iter_shapes(shape.shapes)
+            else:
+                yield shape
+
+    slides = []
+    prs = Presentation(ppt_path)
+    for number, slide in enumerate(prs.slides, start=1):
+        title, texts, tables = "", [], []
+        for shape in iter_shapes(slide.shapes):
+            if getattr(shape, "has_table", False) and shape.has_table:
+                tables.append([[cell.text.strip() for cell in row.cells] for row in shape.table.rows])
+            elif shape.has_text_frame and shape.text.strip():
+                text = shape.text.strip()
+                texts.append(text)
+                if (not title and shape.is_placeholder
+                        and shape.placeholder_format.type in (PP_PLACEHOLDER.TITLE, PP_PLACEHOLDER.CENTER_TITLE)):
+                    title = text
+        notes = ""
+        if slide.has_notes_slide and slide.notes_slide.notes_text_frame is not None:
+            notes = slide.notes_slide.notes_text_frame.text.strip()
+        slides.append({"number": number, "title": title, "texts": texts, "notes": notes, "tables": tables})
+    return slides
+
+
+def parse_presentation_xml(ppt_path):
+    """Fast path for very large decks: stream the slide XML from the zip, without python-pptx.
+
+    Images and other media are never read, and each slide's XML is discarded as it is parsed.
+    """
+    slides = []
+    with zipfile.ZipFile(ppt_path) as package:
+        for number, slide_part in enumerate(_slide_parts(package), start=1):
+            with package.open(slide_part) as stream:
+                shapes, tables = _parse_shapes_xml(stream)
+            texts = [text for _, text in shapes]
+            title = next((text for ph_type, text in shapes if ph_type in _TITLE_TYPES), "")
+            notes = ""
+            notes_part = _related_part(package, slide_part, _NOTES_REL)
+            if notes_part:
+                with package.open(notes_part) as stream:
+                    notes_shapes, _ = _parse_shapes_xml(stream)
+                notes = "\n".join(text for ph_type, text in notes_shapes if ph_type == "body")
+            slides.append({"number": number, "title": title, "texts": texts, "notes": notes, "tables": tables})
+    return slides
+
+
+def _read_rels(package, part):
+    """Relationships of a package part, as {id: (type, resolved target part)}"""
+    rels_part = posixpath.join(posixpath.dirname(part), "_rels", posixpath.basename(part) + ".rels")
+    # NameToInfo : dictionnaire des entrées de l'archive (namelist() reconstruit une liste à chaque appel)
+    if rels_part not in package.NameToInfo:
+        return {}
+    rels = {}
+    with package.open(rels_part) as stream:
+        for rel in ET.parse(stream).getroot().iter(_REL + "Relationship"):
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(part), rel.get("Target")))
+            rels[rel.get("Id")] = (rel.get("Type"), target)
+    return rels
+
+
+def _related_part(package, part, rel_type):
+    for found_type, target in _read_rels(package, part).values():
+        if found_type == rel_type:
+            return target
+    return None
+
+
+def _slide_parts(package):
+    """Slide part names in presentation order (sldIdLst), not in file name order"""
+    rels = _read_rels(package, "ppt/presentation.xml")
+    with package.open("ppt/presentation.xml") as stream:
+        root = ET.parse(stream).getroot()
+    return [rels[slide_id.get(_R + "id")][1] for slide_id in root.iter(_P + "sldId")]
+
+
+def _parse_shapes_xml(stream):
+    """Return ([(placeholder type, text) per text shape], tables) from a slide or notes XML stream"""
+    shapes, tables = [], []
+    paragraphs = None  # paragraphes de la forme courante
+    ph_type = None
+    table = row = cell = None
+    runs = []
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == _P + "sp":
+                paragraphs, ph_type = [], None
+            elif tag == _P + "ph" and paragraphs is not None:
+                ph_type = elem.get("type", "body")
+            elif tag == _A + "tbl":
+                table = []
+            elif tag == _A + "tr":
+                row = []
+            elif tag == _A + "tc":
+                cell = []
+            elif tag == _A + "p":
+                runs = []
+            continue
+
+        if tag == _A + "t":
+            runs.append(elem.text or "")
+        elif tag == _A + "br":
+            runs.append("\n")
+        elif tag == _A + "p":
+            if cell is not None:
+                cell.append("".join(runs))
+            elif paragraphs is not None:
+                paragraphs.append("".join(runs))
+        elif tag == _A + "tc":
+            row.append("\n".join(cell).strip())
+            cell = None
+        elif tag == _A + "tr":
+            table.append(row)
+            row = None
+        elif tag == _A + "tbl":
+            tables.append(table)
+            table = None
+        elif tag == _P + "sp":
+            text = "\n".join(paragraphs).strip()
+            if text:
+                shapes.append((ph_type, text))
+            paragraphs = None
+        # On libère l'arbre au fil de l'eau
+        elem.clear()
+    return shapes, tables
+
+
+def slide_text(slide):
+    """Text of one slide: its shapes, then its tables"""
+    parts = list(slide["texts"])
+    for table in slide["tables"]:
+        parts.extend(cell for row in table for cell in row if cell)
+    return " ".join(parts)
+
+
+def full_text(slides):
+    return " ".join(text for text in (slide_text(slide) for slide in slides) if text)
+
+
+def deck_title(slides):
+    """Title placeholder of the first slide, else its first text"""
+    if not slides:
+        return "Sans titre"
+    first_slide = slides[0]
+    title = first_slide["title"] or (first_slide["texts"][0] if first_slide["texts"] else "")
+    return title or "Sans titre"
+
+
+def toc_hints(slides):
+    """Slide titles in order, the structure the table of contents is built from"""
+    return [f"{slide['number']}. {slide['title']}" for slide in slides if slide["title"]]
@@ -0,0 +1,99 @@
+"""Résumé map-reduce : le texte complet est découpé en morceaux résumés en parallèle (map),
+puis les résumés partiels sont fusionnés en un seul appel final (reduce).
+
+La durée suit le nombre d'étapes (deux appels successifs), pas la longueur du document.
+"""
+import logging
+import os
+
+from llm_stage import get_llm_stage
+from text_chunking import approx_token_count, iter_chunks, tokenizer_counter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_TOKENS = 1500
+# Plafond d'un morceau, bien en dessous du contexte de mistral-tiny
+MAX_CHUNK_TOKENS = 8000
+DEFAULT_MAX_CHUNKS = 16
+OVERLAP_TOKENS = 50
+
+
+def summary_token_counter():
+    """Token counter of the summary model: its tokenizer if SUMMARY_TOKENIZER names one, else an estimate"""
+    tokenizer_name = os.getenv("SUMMARY_TOKENIZER")
+    return tokenizer_counter(tokenizer_name) if tokenizer_name else approx_token_count
+
+
+def plan_chunks(text, chunk_tokens=DEFAULT_CHUNK_TOKENS, max_chunks=DEFAULT_MAX_CHUNKS):
+    """Split the whole text, enlarging chunks when needed so that the fan-out stays around max_chunks"""
+    chunk_tokens = min(MAX_CHUNK_TOKENS, max(chunk_tokens, approx_token_count(text) // max_chunks + 1))
+    return list(iter_chunks(text, chunk_tokens, OVERLAP_TOKENS, summary_token_counter()))
+
+
+def map_request(chunk, index, count, document_kind, model="mistral-tiny"):
+    """Prompt summarizing one part of the document"""
+    return {
+        "model": model,
+        "messages": [
+            {
+                "role": "user",
+                "content": f"""Voici la partie {index}/{count} du texte extrait d'{document_kind}.
+
+                Texte : {chunk}
+
+                Résume les points essentiels de cette partie en 3 à 5 phrases, en conservant
+                les termes importants et sans rien ajouter qui ne figure pas dans le texte."""
+            }
+        ],
+    }
+
+
+def reduce_request(partial_summaries, keywords, document_kind, instructions, model="mistral-tiny"):
+    """Prompt merging the partial summaries into the final summary"""
+    parts = "\n\n".join(f"Partie {i}: {summary}" for i, summary in enumerate(partial_summaries, start=1))
+    return {
+        "model": model,
+        "messages": [
+            {
+                "role": "user",
+                "content": f"""Voici les résumés successifs de toutes les parties d'{document_kind}.
+                Les mots-clés importants sont : {', '.join(keywords)}
+
+                Résumés : {parts}
+
+                Tu dois générer {instructions}"""
+            }
+        ],
+    }
+
+
+def summarize_map_reduce(text, keywords, document_kind, instructions, extra_requests=None,
+                         chunk_tokens=DEFAULT_CHUNK_TOKENS, max_chunks=DEFAULT_MAX_CHUNKS, stage=None):
+    """Summarize the whole text; extra_requests ({name: kwargs}) run alongside the map step.
+
+    Returns (summary, extra results). As with the LLM stage, a failed call comes back as an exception.
+    """
+    stage = stage or get_llm_stage()
+    chunks = plan_chunks(text, chunk_tokens, max_chunks)
+    logger.info(f"Map-reduce summary over {len(chunks)} chunks...")
+
+    requests = dict(extra_requests or {})
+    for i, chunk in enumerate(chunks, start=1):
+        requests[f"chunk_{i}"] = map_request(chunk, i, len(chunks), document_kind)
+    # Map : tous les morceaux (et les requêtes annexes) partent en parallèle, bornés par l'étape LLM
+    results = stage.run(requests)
+    extra = {name: results[name] for name in (extra_requests or {})}
+
+    partial_summaries = []
+    for i in range(1, len(chunks) + 1):
+        output = results[f"chunk_{i}"]
+        if isinstance(output, Exception):
+            logger.error(f"Error summarizing chunk {i}: {str(output)}")
+        elif output:
+            partial_summaries.append(output)
+    if not partial_summaries:
+        return RuntimeError("No chunk could be summarized"), extra
+
+    # Reduce : un seul appel final sur les résumés partiels
+    summary = stage.run({"summary": reduce_request(partial_summaries, keywords, document_kind, instructions)})
+    return summary["summary"], extra
@@ -0,0 +1,84 @@
+"""Découpage du texte en morceaux pour les modèles à contexte limité.
+
+iter_chunks parcourt le texte une seule fois, coupe aux fins de phrase et borne chaque morceau
+par un nombre de tokens (compteur du tokenizer du modèle visé, ou estimation), avec recouvrement
+optionnel. Aucun morceau n'est perdu, même court.
+"""
+import re
+from collections import deque
+
+import model_registry
+
+# Une phrase : jusqu'à la ponctuation finale suivie d'un blanc, ou jusqu'à la fin du texte
+_SENTENCE = re.compile(r"\S.*?(?:[.!?…]+(?=\s)|$)", re.S)
+
+
+def approx_token_count(text):
+    """Cheap token estimate (about 4 characters per token), used when no tokenizer is given"""
+    return max(1, len(text) // 4)
+
+
+def tokenizer_counter(model_name):
+    """Exact token counter based on the model's Hugging Face tokenizer (loaded once per process)"""
+    def load():
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(model_name)
+    tokenizer = model_registry.get_model(("tokenizer", model_name), load)
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def iter_sentences(text):
+    for match in _SENTENCE.finditer(text):
+        sentence = " ".join(match.group().split())
+        if sentence:
+            yield sentence
+
+
+def _split_long_sentence(sentence, max_tokens, count_tokens):
+    """Cut a sentence longer than the budget at word boundaries"""
+    piece, piece_tokens = [], 0
+    for word in sentence.split():
+        word_tokens = count_tokens(word)
+        if piece and piece_tokens + word_tokens > max_tokens:
+            yield " ".join(piece), piece_tokens
+            piece, piece_tokens = [], 0
+        piece.append(word)
+        piece_tokens += word_tokens
+    if piece:
+        yield " ".join(piece), piece_tokens
+
+
+def iter_chunks(text, max_tokens=512, overlap_tokens=0, count_tokens=None):
+    """Yield chunks of at most max_tokens, split at sentence boundaries, in a single pass"""
+    count_tokens = count_tokens or approx_token_count
+    current = deque()  # (phrase, nombre de tokens)
+    current_tokens = 0
+    for sentence in iter_sentences(text):
+        sentence_tokens = count_tokens(sentence)
+        pieces = ([(sentence, sentence_tokens)] if sentence_tokens <= max_tokens
+                  else _split_long_sentence(sentence, max_tokens, count_tokens))
+        for piece, piece_tokens in pieces:
+            if current and current_tokens + piece_tokens > max_tokens:
+                yield " ".join(part for part, _ in current)
+                # Recouvrement : on garde les dernières phrases dans la limite de overlap_tokens
+                while current and (current_tokens > overlap_tokens
+                                   or current_tokens + piece_tokens > max_tokens):
+                    current_tokens -= current.popleft()[1]
+            current.append((piece, piece_tokens))
+            current_tokens += piece_tokens
+    if current:
+        yield " ".join(part for part, _ in current)
+
+
+def sample_evenly(chunks, max_chunks):
+    """At most max_chunks chunks, taken at regular intervals: bounds the cost of very long documents"""
+    if len(chunks) <= max_chunks:
+        return chunks
+    step = len(chunks) / max_chunks
+    return [chunks[int(i * step)] for i in range(max_chunks)]
+
+
+def split_into_chunks(text, chunk_size=8000):
+    """Divise le texte en morceaux de taille similaire en respectant les phrases (taille en caractères)"""
+    # +1 : l'espace qui sépare les phrases une fois le morceau recollé
+    return list(iter_chunks(text, max_tokens=chunk_size, count_tokens=lambda part: len(part) + 1))